@@ -0,0 +1,155 @@
+"""
+Benchmark image listing and lookup queries on a large images table
+
+Builds a throwaway SQLite database (1M rows by default), times the image
+queries against the original unindexed schema, applies the schema
+migrations from repository.py and times them again.
+
+Usage:
+    python benchmarks/bench_image_listing.py [--rows 1000000] [--keys 5000] [--json results.json]
+"""
+
+import argparse
+import json
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import main  # noqa: E402
+from repository import decode_image_cursor, fetch_image_page, run_migrations  # noqa: E402
+
+PAGE_SIZE = main.DEFAULT_IMAGE_PAGE_SIZE
+
+
+def build_database(path: Path, rows: int, keys: int) -> list:
+    """Create the baseline images table and fill it with synthetic rows"""
+    conn = sqlite3.connect(path)
+    conn.execute('''
+        CREATE TABLE images (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            dish_key TEXT,
+            filename TEXT,
+            original_name TEXT,
+            file_path TEXT,
+            upload_time INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    dish_keys = [f"2024-01-15_lunch_dish_{i}" for i in range(keys)]
+    now = int(time.time())
+    rng = random.Random(42)
+
+    def generate():
+        for i in range(rows):
+            key = dish_keys[i % keys]
+            upload_time = now - rng.randint(0, 48 * 3600)
+            filename = f"{upload_time}_{i:08x}.jpg"
+            yield (key, filename, "photo.jpg", f"/data/images/{key}/{filename}", upload_time)
+
+    conn.executemany(
+        "INSERT INTO images (dish_key, filename, original_name, file_path, upload_time) VALUES (?, ?, ?, ?, ?)",
+        generate()
+    )
+    conn.commit()
+    conn.close()
+    return dish_keys
+
+
+def timed(fn, iterations: int) -> dict:
+    """Run fn repeatedly and return latency percentiles in milliseconds"""
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        "p50_ms": round(statistics.median(samples), 3),
+        "p95_ms": round(samples[int(len(samples) * 0.95) - 1], 3),
+        "max_ms": round(samples[-1], 3),
+    }
+
+
+def run_queries(conn: sqlite3.Connection, dish_keys: list, iterations: int) -> dict:
+    rng = random.Random(7)
+    cutoff = int(time.time()) - main.RETENTION_HOURS * 3600
+
+    def full_listing():
+        conn.execute('''
+            SELECT filename, original_name, upload_time, file_path
+            FROM images
+            WHERE dish_key = ? AND file_path IS NOT NULL
+            ORDER BY upload_time DESC
+        ''', (rng.choice(dish_keys),)).fetchall()
+
+    def first_page():
+        fetch_image_page(conn, rng.choice(dish_keys), PAGE_SIZE)
+
+    def page_walk():
+        key = rng.choice(dish_keys)
+        _, cursor = fetch_image_page(conn, key, PAGE_SIZE)
+        while cursor:
+            _, cursor = fetch_image_page(conn, key, PAGE_SIZE, decode_image_cursor(cursor))
+
+    def file_lookup():
+        key = rng.choice(dish_keys)
+        conn.execute(
+            "SELECT file_path FROM images WHERE dish_key = ? AND filename = ?",
+            (key, "missing.jpg")
+        ).fetchone()
+
+    def cleanup_scan():
+        conn.execute("SELECT COUNT(*) FROM images WHERE upload_time < ?", (cutoff,)).fetchone()
+
+    return {
+        "full_listing": timed(full_listing, iterations),
+        "first_page": timed(first_page, iterations),
+        "page_walk": timed(page_walk, max(1, iterations // 5)),
+        "file_lookup": timed(file_lookup, iterations),
+        "cleanup_scan": timed(cleanup_scan, max(1, iterations // 5)),
+    }
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--keys", type=int, default=5000)
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--json", type=Path, help="Write results to this file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / "bench.db"
+        start = time.perf_counter()
+        dish_keys = build_database(db_path, args.rows, args.keys)
+        print(f"Built {args.rows} rows over {args.keys} keys in {time.perf_counter() - start:.1f}s")
+
+        conn = sqlite3.connect(db_path)
+        conn.row_factory = sqlite3.Row
+        results = {"rows": args.rows, "keys": args.keys, "page_size": PAGE_SIZE}
+        results["unindexed"] = run_queries(conn, dish_keys, args.iterations)
+
+        start = time.perf_counter()
+        run_migrations(conn)
+        results["migration_seconds"] = round(time.perf_counter() - start, 2)
+        results["indexed"] = run_queries(conn, dish_keys, args.iterations)
+        conn.close()
+
+    print(f"{'query':<14} {'unindexed p50':>14} {'indexed p50':>12} {'indexed p95':>12}")
+    for name, before in results["unindexed"].items():
+        after = results["indexed"][name]
+        print(f"{name:<14} {before['p50_ms']:>12.3f}ms {after['p50_ms']:>10.3f}ms {after['p95_ms']:>10.3f}ms")
+    print(f"Migration took {results['migration_seconds']}s")
+
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main_cli()
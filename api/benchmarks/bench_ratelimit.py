@@ -0,0 +1,116 @@
+"""
+Measure rate limiter overhead per request
+
+Times limiter.acquire() and a full pass through RateLimitMiddleware around a
+no-op ASGI app for the memory and SQLite backends, and checks that the SQLite
+backend enforces one shared limit across several processes.
+
+Usage:
+    python benchmarks/bench_ratelimit.py [--requests 100000] [--json results.json]
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from ratelimit import MemoryRateLimiter, RateLimitMiddleware, RateLimitPolicy, SqliteRateLimiter  # noqa: E402
+
+POLICY = RateLimitPolicy("read", ("GET",), ("/api/votes",), rate=1e9, burst=10**9)
+
+
+async def noop_app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b""})
+
+
+async def noop_send(message):
+    pass
+
+
+async def noop_receive():
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+
+def bench_acquire(limiter, requests: int, clients: int) -> float:
+    """Return microseconds per acquire() call"""
+    keys = [f"read:10.0.{i // 256}.{i % 256}" for i in range(clients)]
+    start = time.perf_counter()
+    for i in range(requests):
+        limiter.acquire(keys[i % clients], POLICY.rate, POLICY.burst)
+    return (time.perf_counter() - start) / requests * 1e6
+
+
+def bench_middleware(limiter, requests: int, clients: int) -> float:
+    """Return microseconds of middleware overhead per request compared to the bare app"""
+    middleware = RateLimitMiddleware(noop_app, limiter, [POLICY])
+    scopes = [
+        {"type": "http", "method": "GET", "path": "/api/votes/key", "headers": [], "client": (f"10.0.{i // 256}.{i % 256}", 1234)}
+        for i in range(clients)
+    ]
+
+    async def run(app):
+        start = time.perf_counter()
+        for i in range(requests):
+            await app(scopes[i % clients], noop_receive, noop_send)
+        return time.perf_counter() - start
+
+    bare = asyncio.run(run(noop_app))
+    wrapped = asyncio.run(run(middleware))
+    return (wrapped - bare) / requests * 1e6
+
+
+def shared_worker(db_path, attempts, queue):
+    limiter = SqliteRateLimiter(Path(db_path))
+    allowed = sum(1 for _ in range(attempts) if limiter.acquire("vote:shared", 0.001, 20)[0])
+    queue.put(allowed)
+
+
+def check_shared_limit(db_path: Path, processes: int = 4, attempts: int = 50) -> int:
+    """Return how many requests several processes were allowed in total on a burst of 20"""
+    SqliteRateLimiter(db_path)
+    queue = multiprocessing.Queue()
+    workers = [multiprocessing.Process(target=shared_worker, args=(str(db_path), attempts, queue)) for _ in range(processes)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return sum(queue.get() for _ in workers)
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Measure rate limiter overhead")
+    parser.add_argument("--requests", type=int, default=100000)
+    parser.add_argument("--clients", type=int, default=5000, help="Distinct client IPs")
+    parser.add_argument("--json", type=Path, help="Write results to this file")
+    args = parser.parse_args()
+
+    results = {"requests": args.requests, "clients": args.clients}
+    with tempfile.TemporaryDirectory() as tmp:
+        limiters = {
+            "memory": MemoryRateLimiter(),
+            "sqlite": SqliteRateLimiter(Path(tmp) / "ratelimit.db"),
+        }
+        for name, limiter in limiters.items():
+            results[name] = {
+                "acquire_us": round(bench_acquire(limiter, args.requests, args.clients), 2),
+                "middleware_overhead_us": round(bench_middleware(limiter, args.requests, args.clients), 2),
+            }
+            print(f"{name:<7} acquire {results[name]['acquire_us']:>7.2f}us  "
+                  f"middleware overhead {results[name]['middleware_overhead_us']:>7.2f}us")
+
+        results["shared_allowed"] = check_shared_limit(Path(tmp) / "shared.db")
+        print(f"4 processes x 50 requests against a shared burst of 20: {results['shared_allowed']} allowed")
+
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,182 @@
+"""
+Measure API cold start and enforce an import-time budget
+
+Imports main in fresh interpreters under `python -X importtime`, reports the
+slowest imports pulled in by main, and times app startup plus the first
+request. Exits non-zero when main's own median import time (without the web
+framework, see FRAMEWORK_MODULES) exceeds the budget or when a module that
+should be imported lazily (PIL, requests, boto3, psycopg) is loaded at import
+time, so it can run as a CI check.
+
+Usage:
+    python benchmarks/bench_startup.py [--runs 5] [--budget-ms 100] [--json results.json]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+API_DIR = Path(__file__).resolve().parent.parent
+
+# Used on first use only; importing any of them from main is a regression
+LAZY_MODULES = ("PIL", "requests", "boto3", "botocore", "psycopg", "psycopg_pool")
+
+# Framework imports don't count against the budget: their cost depends on the machine
+# (most of `import main` on a shared CI runner) but not on main's own code
+FRAMEWORK_MODULES = ("fastapi", "starlette", "pydantic", "pydantic_core", "anyio", "typing_extensions")
+
+# Runs in the child: time startup and the first request after `import main`
+FIRST_REQUEST_SCRIPT = """
+import json, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+from fastapi.testclient import TestClient
+client_ready = time.perf_counter()
+with TestClient(main.app) as client:
+    status = client.get("/health").status_code
+done = time.perf_counter()
+print(json.dumps({
+    "import_s": imported - start,
+    "startup_first_request_s": done - client_ready,
+    "status": status,
+}))
+"""
+
+
+def parse_importtime(stderr: str) -> list:
+    """Return (depth, module, self_us, cumulative_us) for each -X importtime line"""
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip(" ")) - 1) // 2
+        entries.append((depth, name.strip(), int(self_us), int(cumulative_us)))
+    return entries
+
+
+def main_imports(entries: list) -> tuple:
+    """Return main's cumulative import time and its direct imports"""
+    children = []
+    for depth, name, _, cumulative_us in entries:
+        if depth == 1:
+            children.append((name, cumulative_us))
+        elif depth == 0:
+            if name == "main":
+                return cumulative_us, children
+            children = []
+    raise RuntimeError("main was not imported")
+
+
+def framework_us(entries: list) -> int:
+    """Return the cumulative import time of FRAMEWORK_MODULES within main's imports"""
+    main_index = next(i for i, (depth, name, _, _) in enumerate(entries) if depth == 0 and name == "main")
+    start = main_index
+    while start > 0 and entries[start - 1][0] > 0:
+        start -= 1
+    total = 0
+    skip_depth = None
+    # Parents are listed after their imports; walk backwards so a framework
+    # module is counted once, without the framework modules it imports itself
+    for depth, name, _, cumulative_us in reversed(entries[start:main_index]):
+        if skip_depth is not None and depth > skip_depth:
+            continue
+        skip_depth = None
+        if name.split(".")[0] in FRAMEWORK_MODULES:
+            total += cumulative_us
+            skip_depth = depth
+    return total
+
+
+def run_once(data_dir: Path) -> dict:
+    env = dict(os.environ, DATA_DIR=str(data_dir), PYTHONDONTWRITEBYTECODE="1")
+    # The S3 backend, so importing boto3 at import time shows up in lazy_imported;
+    # the bucket is never reached since /health doesn't touch image storage
+    env.update(
+        IMAGE_STORAGE_BACKEND="s3",
+        S3_BUCKET="startup-bench",
+        S3_ENDPOINT_URL="http://127.0.0.1:9",
+        S3_ACCESS_KEY_ID="startup-bench",
+        S3_SECRET_ACCESS_KEY="startup-bench",
+    )
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", FIRST_REQUEST_SCRIPT],
+        cwd=API_DIR, env=env, capture_output=True, text=True, check=True
+    )
+    entries = parse_importtime(result.stderr)
+    main_us, children = main_imports(entries)
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    # Modules loaded later by the test client don't count, only those up to main
+    main_index = next(i for i, (depth, name, _, _) in enumerate(entries) if depth == 0 and name == "main")
+    imported = {name.split(".")[0] for _, name, _, _ in entries[:main_index]}
+    return {
+        "main_import_ms": main_us / 1000,
+        "framework_import_ms": framework_us(entries) / 1000,
+        "children": children,
+        "startup_first_request_ms": timings["startup_first_request_s"] * 1000,
+        "status": timings["status"],
+        "lazy_imported": sorted(imported.intersection(LAZY_MODULES)),
+    }
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Measure API cold start")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters to start")
+    parser.add_argument(
+        "--budget-ms", type=float, default=100.0, help="Maximum median import time of main, without the framework"
+    )
+    parser.add_argument("--top", type=int, default=10, help="Slowest direct imports to list")
+    parser.add_argument("--json", type=Path, help="Write results to this file")
+    args = parser.parse_args()
+
+    runs = []
+    for _ in range(args.runs):
+        # A fresh data directory each time, like a new container
+        with tempfile.TemporaryDirectory() as tmp:
+            runs.append(run_once(Path(tmp) / "data"))
+
+    import_ms = statistics.median(run["main_import_ms"] for run in runs)
+    own_ms = statistics.median(run["main_import_ms"] - run["framework_import_ms"] for run in runs)
+    startup_ms = statistics.median(run["startup_first_request_ms"] for run in runs)
+    slowest = sorted(runs[-1]["children"], key=lambda child: -child[1])[:args.top]
+    lazy_imported = sorted({name for run in runs for name in run["lazy_imported"]})
+
+    print(f"import main          {import_ms:>8.1f}ms (median of {args.runs})")
+    print(f"  without framework  {own_ms:>8.1f}ms (budget {args.budget_ms:.0f}ms)")
+    print(f"startup + /health    {startup_ms:>8.1f}ms")
+    print("slowest imports from main:")
+    for name, cumulative_us in slowest:
+        print(f"  {name:<30} {cumulative_us / 1000:>8.1f}ms")
+
+    results = {
+        "runs": args.runs,
+        "main_import_ms": round(import_ms, 1),
+        "main_own_import_ms": round(own_ms, 1),
+        "startup_first_request_ms": round(startup_ms, 1),
+        "budget_ms": args.budget_ms,
+        "slowest_imports": [{"module": name, "ms": round(us / 1000, 1)} for name, us in slowest],
+        "lazy_modules_imported": lazy_imported,
+    }
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2))
+
+    failures = []
+    if own_ms > args.budget_ms:
+        failures.append(f"import main took {own_ms:.1f}ms without the framework, over the {args.budget_ms:.0f}ms budget")
+    if lazy_imported:
+        failures.append(f"imported at startup but should load on first use: {', '.join(lazy_imported)}")
+    if any(run["status"] != 200 for run in runs):
+        failures.append("GET /health did not return 200")
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,131 @@
+"""
+Benchmark image storage backends
+
+Measures upload, serve and delete throughput for the local-disk backend and,
+when an endpoint is given, for the S3-compatible backend. Run a local MinIO
+to benchmark S3 without touching real buckets:
+
+    docker run -d -p 9000:9000 -e MINIO_ROOT_USER=minio -e MINIO_ROOT_PASSWORD=minio123 \\
+        minio/minio server /data
+    python benchmarks/bench_storage.py --s3-endpoint http://localhost:9000 \\
+        --s3-access-key minio --s3-secret-key minio123
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fastapi.responses import FileResponse  # noqa: E402
+from storage import ImageStorage, LocalImageStorage, S3ImageStorage  # noqa: E402
+
+
+def drain(response) -> int:
+    """Consume a storage response body and return the number of bytes read"""
+    if isinstance(response, FileResponse):
+        return len(Path(response.path).read_bytes())
+    if response.status_code in (301, 302, 307):
+        return 0
+
+    async def consume():
+        total = 0
+        async for chunk in response.body_iterator:
+            total += len(chunk)
+        return total
+
+    return asyncio.run(consume())
+
+
+def bench_backend(storage: ImageStorage, payload: bytes, count: int, concurrency: int) -> dict:
+    """Upload, serve and delete `count` images with `concurrency` threads"""
+    def upload(i):
+        return storage.save("bench_dish", f"{i:06d}.jpg", io.BytesIO(payload), "image/jpeg")
+
+    def serve(location):
+        response = storage.response(location, "image/jpeg")
+        if response is None:
+            raise RuntimeError(f"Missing image {location}")
+        return drain(response)
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        start = time.perf_counter()
+        locations = list(pool.map(upload, range(count)))
+        elapsed = time.perf_counter() - start
+        results["upload"] = {
+            "ops_per_s": round(count / elapsed, 1),
+            "mb_per_s": round(count * len(payload) / elapsed / 1e6, 2),
+        }
+
+        start = time.perf_counter()
+        list(pool.map(serve, locations))
+        elapsed = time.perf_counter() - start
+        results["serve"] = {
+            "ops_per_s": round(count / elapsed, 1),
+            "mb_per_s": round(count * len(payload) / elapsed / 1e6, 2),
+        }
+
+    start = time.perf_counter()
+    storage.delete_many(locations)
+    results["delete"] = {"ops_per_s": round(count / (time.perf_counter() - start), 1)}
+    return results
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Benchmark image storage backends")
+    parser.add_argument("--count", type=int, default=200, help="Images per phase")
+    parser.add_argument("--size-kb", type=int, default=2048, help="Image payload size")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--s3-endpoint", default=os.getenv("S3_ENDPOINT_URL"))
+    parser.add_argument("--s3-bucket", default=os.getenv("S3_BUCKET", "eatinator-bench"))
+    parser.add_argument("--s3-access-key", default=os.getenv("S3_ACCESS_KEY_ID"))
+    parser.add_argument("--s3-secret-key", default=os.getenv("S3_SECRET_ACCESS_KEY"))
+    parser.add_argument("--s3-region", default=os.getenv("S3_REGION", "us-east-1"))
+    parser.add_argument("--json", type=Path, help="Write results to this file")
+    args = parser.parse_args()
+
+    payload = os.urandom(args.size_kb * 1024)
+    results = {"count": args.count, "size_kb": args.size_kb, "concurrency": args.concurrency}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        results["local"] = bench_backend(LocalImageStorage(Path(tmp)), payload, args.count, args.concurrency)
+
+    if args.s3_endpoint:
+        storage = S3ImageStorage(
+            bucket=args.s3_bucket,
+            prefix="bench",
+            endpoint_url=args.s3_endpoint,
+            region=args.s3_region,
+            access_key=args.s3_access_key,
+            secret_key=args.s3_secret_key,
+            max_pool_connections=max(10, args.concurrency * 2),
+        )
+        try:
+            storage.client.create_bucket(Bucket=args.s3_bucket)
+        except storage.client.exceptions.BucketAlreadyOwnedByYou:
+            pass
+        results["s3"] = bench_backend(storage, payload, args.count, args.concurrency)
+
+    for backend in ("local", "s3"):
+        if backend not in results:
+            continue
+        for phase, numbers in results[backend].items():
+            line = f"{backend:<6} {phase:<7} {numbers['ops_per_s']:>9.1f} ops/s"
+            if "mb_per_s" in numbers:
+                line += f" {numbers['mb_per_s']:>9.2f} MB/s"
+            print(line)
+
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,464 @@
+"""
+Lunch-rush load test for the Eatinator API
+
+Starts the API (under uvicorn or in-process) against local stub servers for the
+AI /api/generate endpoint and Turnstile siteverify, then replays a lunch-window
+traffic mix with a pool of virtual users:
+
+- page_load: a menu page fanning out vote and image-list GETs for every dish,
+  sometimes followed by opening an image
+- vote: a vote for a lunch dish, cast inside the lunch voting window
+  (VOTING_TIMES in js/voting.js)
+- upload: a multipart upload of a real JPEG photo
+- ai_chat: a streaming AI chat over server-sent events
+
+Reports throughput, p50/p95/p99 latency and error rate per route and saves the
+results as JSON so runs can be compared across commits.
+
+Usage:
+    pip install httpx
+    python benchmarks/loadtest.py --users 50 --duration 60 --output results.json
+    python benchmarks/loadtest.py --compare results.json --output new.json
+"""
+
+import argparse
+import asyncio
+import datetime
+import io
+import json
+import os
+import platform
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import httpx
+
+API_DIR = Path(__file__).resolve().parent.parent
+
+DISHES = [
+    "Zuercher Geschnetzeltes", "Vegi Curry", "Spaghetti Bolognese", "Caesar Salad",
+    "Rindsbratwurst", "Falafel Bowl", "Tagessuppe", "Apfelstrudel",
+]
+MENU_TYPES = ["menu", "vegi", "pasta", "salad", "grill", "bowl", "soup", "dessert"]
+
+# Share of virtual-user actions during the lunch window
+DEFAULT_MIX = {"page_load": 0.70, "vote": 0.15, "upload": 0.05, "ai_chat": 0.10}
+
+
+# --- Stub upstream servers -------------------------------------------------
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Answers the AI generate and Turnstile siteverify endpoints"""
+
+    ai_ttft = 0.3
+    ai_token_delay = 0.02
+    ai_tokens = 40
+    turnstile_delay = 0.03
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path.endswith("/siteverify"):
+            time.sleep(self.turnstile_delay)
+            self._json({"success": True})
+        elif self.path.endswith("/api/generate"):
+            payload = json.loads(body or b"{}")
+            if payload.get("stream"):
+                self._stream_generate()
+            else:
+                time.sleep(self.ai_ttft + self.ai_tokens * self.ai_token_delay)
+                self._json({"response": "Try the Vegi Curry. " * 5, "done": True})
+        else:
+            self.send_error(404)
+
+    def _json(self, data):
+        body = json.dumps(data).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _stream_generate(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+        time.sleep(self.ai_ttft)
+        for i in range(self.ai_tokens):
+            self.wfile.write(json.dumps({"response": f"token{i} ", "done": False}).encode() + b"\n")
+            self.wfile.flush()
+            time.sleep(self.ai_token_delay)
+        self.wfile.write(json.dumps({"response": "", "done": True}).encode() + b"\n")
+
+
+def start_stub_server() -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# --- Starting the API ------------------------------------------------------
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def api_environment(data_dir: Path, stub_url: str, rate_limit: bool) -> dict:
+    return {
+        "DATA_DIR": str(data_dir),
+        "AI_API_URL": f"{stub_url}/api/generate",
+        "TURNSTILE_VERIFY_URL": f"{stub_url}/siteverify",
+        "TURNSTILE_SECRET_KEY": "loadtest-secret",
+        "RATE_LIMIT_ENABLED": "true" if rate_limit else "false",
+        # Virtual users send their own address in X-Forwarded-For, like nginx would
+        "RATE_LIMIT_TRUSTED_PROXIES": "127.0.0.1",
+        "METRICS_DIR": str(data_dir / "metrics"),
+    }
+
+
+def start_uvicorn(env: dict, workers: int) -> tuple:
+    """Run the API in a uvicorn subprocess and return (process, base_url)"""
+    port = free_port()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        cwd=API_DIR,
+        env={**os.environ, **env},
+    )
+    return process, f"http://127.0.0.1:{port}"
+
+
+def start_in_process(env: dict) -> tuple:
+    """Run the API on a uvicorn server thread in this process and return (server, base_url)"""
+    import uvicorn
+
+    os.environ.update(env)
+    sys.path.insert(0, str(API_DIR))
+    import main
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    return server, f"http://127.0.0.1:{port}"
+
+
+async def wait_until_healthy(base_url: str, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get(f"{base_url}/health")).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"API at {base_url} did not become healthy within {timeout}s")
+
+
+# --- Workload --------------------------------------------------------------
+
+def make_photo(seed: int, width: int = 1600, height: int = 1200) -> bytes:
+    """Encode a photo-like JPEG (smooth gradients plus sensor noise)"""
+    from PIL import Image, ImageFilter
+
+    rng = random.Random(seed)
+    small = Image.frombytes("RGB", (32, 24), bytes(rng.randrange(256) for _ in range(32 * 24 * 3)))
+    photo = small.resize((width, height), Image.BICUBIC).filter(ImageFilter.GaussianBlur(8))
+    noise = Image.effect_noise((width, height), 12).convert("RGB")
+    photo = Image.blend(photo, noise, 0.08)
+    buffer = io.BytesIO()
+    photo.save(buffer, "JPEG", quality=85)
+    return buffer.getvalue()
+
+
+def load_photos(images_dir, count: int) -> list:
+    if images_dir:
+        paths = sorted(p for p in Path(images_dir).iterdir() if p.suffix.lower() in (".jpg", ".jpeg"))
+        if paths:
+            return [path.read_bytes() for path in paths]
+    return [make_photo(seed) for seed in range(count)]
+
+
+class Recorder:
+    """Collects latency samples and status codes per route"""
+
+    def __init__(self):
+        self.samples = {}
+        self.errors = {}
+        self.statuses = {}
+        self.recording = False
+
+    def record(self, route: str, latency: float, status):
+        if not self.recording:
+            return
+        self.samples.setdefault(route, []).append(latency)
+        self.statuses.setdefault(route, {}).setdefault(str(status), 0)
+        self.statuses[route][str(status)] += 1
+        if not isinstance(status, int) or status >= 400:
+            self.errors[route] = self.errors.get(route, 0) + 1
+
+
+class VirtualUser:
+    def __init__(self, client: httpx.AsyncClient, recorder: Recorder, photos: list, mix: dict, think_time: float, rng: random.Random):
+        self.client = client
+        self.recorder = recorder
+        self.photos = photos
+        self.mix = mix
+        self.think_time = think_time
+        self.rng = rng
+        self.date = datetime.date.today().isoformat()
+        self._new_visitor()
+
+    def _new_visitor(self):
+        self.user_id = f"user_{int(time.time() * 1000)}_{uuid.uuid4().hex[:9]}"
+        self.headers = {"X-Forwarded-For": f"10.{self.rng.randrange(256)}.{self.rng.randrange(256)}.{self.rng.randrange(1, 255)}"}
+        self.voted = set()
+
+    def vote_key(self, index: int) -> str:
+        dish = DISHES[index].replace(" ", "_")
+        return f"vote_{self.date}_lunch_{dish}_{MENU_TYPES[index]}"
+
+    def image_key(self, index: int) -> str:
+        dish = DISHES[index].replace(" ", "_")
+        return f"img_{self.date}_{dish}_{MENU_TYPES[index]}"
+
+    async def request(self, route: str, method: str, url: str, **kwargs) -> httpx.Response:
+        start = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, headers=self.headers, **kwargs)
+        except httpx.HTTPError as e:
+            self.recorder.record(route, time.perf_counter() - start, type(e).__name__)
+            return None
+        self.recorder.record(route, time.perf_counter() - start, response.status_code)
+        return response
+
+    async def page_load(self):
+        responses = await asyncio.gather(*(
+            request
+            for index in range(len(DISHES))
+            for request in (
+                self.request("GET /api/votes/{key}", "GET", f"/api/votes/{self.vote_key(index)}"),
+                self.request("GET /api/images/{key}", "GET", f"/api/images/{self.image_key(index)}"),
+            )
+        ))
+        # Some visitors open a photo from the gallery
+        if self.rng.random() < 0.2:
+            for response in responses[1::2]:
+                images = response.json().get("images") if response is not None and response.status_code == 200 else None
+                if images:
+                    await self.request("GET /api/images/{key}/{file}", "GET", images[0]["url"])
+                    break
+
+    async def vote(self):
+        remaining = [index for index in range(len(DISHES)) if index not in self.voted]
+        if not remaining:
+            self._new_visitor()
+            remaining = list(range(len(DISHES)))
+        index = self.rng.choice(remaining)
+        self.voted.add(index)
+        await self.request("POST /api/votes", "POST", "/api/votes", json={
+            "key": self.vote_key(index),
+            "voteType": self.rng.choices(["good", "neutral", "bad"], [0.6, 0.25, 0.15])[0],
+            "userId": self.user_id,
+            "turnstileToken": "loadtest-token",
+        })
+
+    async def upload(self):
+        index = self.rng.randrange(len(DISHES))
+        await self.request("POST /api/images", "POST", "/api/images",
+                           data={"key": self.image_key(index), "turnstileToken": "loadtest-token"},
+                           files={"image": ("photo.jpg", self.rng.choice(self.photos), "image/jpeg")})
+
+    async def ai_chat(self):
+        payload = {
+            "message": "What should I eat today if I am vegetarian?",
+            "context": {"language": "en", "items": [{"name": name} for name in DISHES], "category": "lunch",
+                        "restaurant": "Kaserne Bern", "date": self.date},
+            "turnstileToken": "loadtest-token",
+        }
+        start = time.perf_counter()
+        status = None
+        try:
+            async with self.client.stream("POST", "/api/ai", json=payload, headers={**self.headers, "Accept": "text/event-stream"}) as response:
+                status = response.status_code
+                first = True
+                async for line in response.aiter_lines():
+                    if first and line.startswith("data:"):
+                        self.recorder.record("AI first chunk", time.perf_counter() - start, status)
+                        first = False
+                    if '"error"' in line:
+                        status = "stream_error"
+        except httpx.HTTPError as e:
+            status = type(e).__name__
+        self.recorder.record("POST /api/ai (stream)", time.perf_counter() - start, status)
+
+    async def run(self, stop_at: float):
+        names = list(self.mix)
+        weights = [self.mix[name] for name in names]
+        while time.monotonic() < stop_at:
+            await getattr(self, self.rng.choices(names, weights)[0])()
+            await asyncio.sleep(self.rng.expovariate(1 / self.think_time) if self.think_time > 0 else 0)
+
+
+async def run_load(base_url: str, args, photos: list) -> dict:
+    recorder = Recorder()
+    limits = httpx.Limits(max_connections=args.users * 4, max_keepalive_connections=args.users * 2)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=120) as client:
+        users = [
+            VirtualUser(client, recorder, photos, args.mix, args.think_time, random.Random(args.seed + i))
+            for i in range(args.users)
+        ]
+        start = time.monotonic()
+        stop_at = start + args.warmup + args.duration
+        tasks = [asyncio.create_task(user.run(stop_at)) for user in users]
+        await asyncio.sleep(args.warmup)
+        recorder.recording = True
+        measured_start = time.monotonic()
+        await asyncio.gather(*tasks)
+        elapsed = time.monotonic() - measured_start
+
+    routes = {}
+    for route, samples in sorted(recorder.samples.items()):
+        samples.sort()
+        routes[route] = {
+            "count": len(samples),
+            "rps": round(len(samples) / elapsed, 2),
+            "error_rate": round(recorder.errors.get(route, 0) / len(samples), 4),
+            "p50_ms": round(statistics.median(samples) * 1000, 2),
+            "p95_ms": round(percentile(samples, 0.95) * 1000, 2),
+            "p99_ms": round(percentile(samples, 0.99) * 1000, 2),
+            "statuses": recorder.statuses.get(route, {}),
+        }
+    total = sum(route["count"] for name, route in routes.items() if name != "AI first chunk")
+    errors = sum(recorder.errors.get(name, 0) for name in routes if name != "AI first chunk")
+    return {
+        "elapsed_s": round(elapsed, 2),
+        "total_requests": total,
+        "total_rps": round(total / elapsed, 2),
+        "total_error_rate": round(errors / total, 4) if total else 0.0,
+        "routes": routes,
+    }
+
+
+def percentile(samples: list, fraction: float) -> float:
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+# --- Reporting -------------------------------------------------------------
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=API_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def print_report(results: dict, baseline: dict = None):
+    print(f"\n{'route':<32} {'count':>7} {'rps':>8} {'err%':>6} {'p50ms':>9} {'p95ms':>9} {'p99ms':>9}")
+    for route, numbers in results["routes"].items():
+        line = (f"{route:<32} {numbers['count']:>7} {numbers['rps']:>8.1f} {numbers['error_rate'] * 100:>6.2f} "
+                f"{numbers['p50_ms']:>9.1f} {numbers['p95_ms']:>9.1f} {numbers['p99_ms']:>9.1f}")
+        old = (baseline or {}).get("routes", {}).get(route)
+        if old and old["p95_ms"]:
+            line += f"  p95 {(numbers['p95_ms'] / old['p95_ms'] - 1) * 100:+.1f}%"
+        print(line)
+    print(f"\nTotal: {results['total_requests']} requests, {results['total_rps']} req/s, "
+          f"{results['total_error_rate'] * 100:.2f}% errors over {results['elapsed_s']}s")
+    if baseline:
+        print(f"Baseline ({baseline['meta']['commit']}): {baseline['total_rps']} req/s, "
+              f"{baseline['total_error_rate'] * 100:.2f}% errors")
+
+
+def parse_mix(value: str) -> dict:
+    """Parse 'page_load=0.7,vote=0.15,...' into weights"""
+    mix = {}
+    for part in value.split(","):
+        name, weight = part.split("=")
+        if name not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"Unknown scenario: {name}")
+        mix[name] = float(weight)
+    return mix
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Replay lunch-rush traffic against the Eatinator API")
+    parser.add_argument("--mode", choices=["uvicorn", "inprocess"], default="uvicorn")
+    parser.add_argument("--target", help="Load an already running API instead of starting one (no stubs)")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers in uvicorn mode")
+    parser.add_argument("--users", type=int, default=50, help="Concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=60.0, help="Measured seconds")
+    parser.add_argument("--warmup", type=float, default=5.0, help="Unmeasured seconds before measuring")
+    parser.add_argument("--think-time", type=float, default=0.5, help="Mean pause between user actions")
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX, help="e.g. page_load=0.7,vote=0.15,upload=0.05,ai_chat=0.1")
+    parser.add_argument("--images-dir", help="Directory of real JPEGs to upload (default: generated photos)")
+    parser.add_argument("--ai-ttft", type=float, default=0.3, help="Stub AI delay before the first token")
+    parser.add_argument("--ai-token-delay", type=float, default=0.02, help="Stub AI delay between tokens")
+    parser.add_argument("--rate-limit", action="store_true", help="Keep the API rate limiter enabled")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", type=Path, help="Write results JSON here")
+    parser.add_argument("--compare", type=Path, help="Earlier results JSON to compare against")
+    args = parser.parse_args()
+
+    StubHandler.ai_ttft = args.ai_ttft
+    StubHandler.ai_token_delay = args.ai_token_delay
+    photos = load_photos(args.images_dir, 8)
+
+    process = server = None
+    with tempfile.TemporaryDirectory() as data_dir:
+        if args.target:
+            base_url = args.target.rstrip("/")
+        else:
+            stub = start_stub_server()
+            env = api_environment(Path(data_dir), f"http://127.0.0.1:{stub.server_address[1]}", args.rate_limit)
+            if args.mode == "uvicorn":
+                process, base_url = start_uvicorn(env, args.workers)
+            else:
+                server, base_url = start_in_process(env)
+
+        try:
+            asyncio.run(wait_until_healthy(base_url))
+            print(f"Running {args.users} users for {args.duration}s against {base_url} ...")
+            results = asyncio.run(run_load(base_url, args, photos))
+        finally:
+            if process:
+                process.terminate()
+                process.wait(timeout=30)
+            if server:
+                server.should_exit = True
+
+    results["meta"] = {
+        "commit": git_commit(),
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "mode": "target" if args.target else args.mode,
+        "workers": args.workers,
+        "users": args.users,
+        "duration": args.duration,
+        "think_time": args.think_time,
+        "mix": args.mix,
+        "seed": args.seed,
+        "photo_bytes_avg": int(sum(map(len, photos)) / len(photos)),
+    }
+
+    baseline = json.loads(args.compare.read_text()) if args.compare else None
+    print_report(results, baseline)
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,71 @@
+"""
+Request body size limits for Eatinator
+Rejects oversized uploads with 413 before the body is spooled and parsed
+"""
+
+from typing import Dict, Optional
+import json
+
+from starlette.exceptions import HTTPException
+
+
+class BodySizeLimitMiddleware:
+    """ASGI middleware capping the request body size of selected paths
+
+    limits maps an exact path to its maximum body size in bytes. A declared
+    Content-Length over the limit is rejected before anything is read; chunked
+    bodies are counted while the app reads them and stopped once they pass it.
+    """
+
+    def __init__(self, app, limits: Dict[str, int], detail: str = "Request body too large"):
+        self.app = app
+        self.limits = dict(limits)
+        self.detail = detail
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.limits:
+            await self.app(scope, receive, send)
+            return
+
+        limit = self.limits[scope["path"]]
+        content_length = self._content_length(scope)
+        if content_length is not None and content_length > limit:
+            await self._reject(send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    # Raised while the app parses the form, before it has responded
+                    raise HTTPException(413, self.detail)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+    @staticmethod
+    def _content_length(scope) -> Optional[int]:
+        for name, value in scope["headers"]:
+            if name == b"content-length":
+                try:
+                    return int(value)
+                except ValueError:
+                    return None
+        return None
+
+    async def _reject(self, send):
+        body = json.dumps({"detail": self.detail}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"connection", b"close"),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,258 @@
+"""
+Write-invalidated response cache for Eatinator
+Pre-serialized JSON bodies with weak ETags, kept coherent across uvicorn workers
+through per-key generation files, or across replicas through the database
+"""
+
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import hashlib
+import json
+import logging
+import os
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+class GenerationStore:
+    """Per-key version counters shared by every worker through a directory
+
+    Each key has one small file. A bump atomically replaces it with a new file,
+    which always gets a new inode, so the version is read with a single stat()
+    and without opening the file. Only workers that see the same directory
+    share it; replicas on other hosts use RepositoryGenerationStore.
+
+    Keys without a file share the version of the epoch file, which prune()
+    replaces before removing anything, so a pruned key never returns to an
+    ETag that was handed out before its first write.
+    """
+
+    EPOCH = "epoch"
+
+    # version() is a local stat(), cheap enough to call on the event loop
+    blocking = False
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+
+    def _path(self, key: str) -> Path:
+        return self.directory / hashlib.sha1(key.encode()).hexdigest()
+
+    def version(self, key: str) -> str:
+        version = self._stat_version(self._path(key))
+        if version == "0":
+            return f"0.{self._stat_version(self.directory / self.EPOCH)}"
+        return version
+
+    @staticmethod
+    def _stat_version(path: Path) -> str:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return "0"
+        return f"{stat.st_ino:x}.{stat.st_mtime_ns:x}"
+
+    def versions(self, keys: List[str]) -> Dict[str, str]:
+        return {key: self.version(key) for key in keys}
+
+    def bump(self, key: str):
+        self._replace(self._path(key), key)
+
+    def _replace(self, path: Path, content: str):
+        temp = path.with_name(f"{path.name}.{os.getpid()}.{uuid.uuid4().hex}")
+        try:
+            temp.write_text(content)
+        except FileNotFoundError:
+            # The directory is created on the first write rather than at import
+            self.directory.mkdir(parents=True, exist_ok=True)
+            temp.write_text(content)
+        os.replace(temp, path)
+
+    def prune(self, max_age: float) -> int:
+        """Remove generation files untouched for max_age seconds"""
+        cutoff = time.time() - max_age
+        if not self.directory.is_dir():
+            return 0
+        stale = []
+        for path in self.directory.iterdir():
+            try:
+                if path.name != self.EPOCH and path.stat().st_mtime < cutoff:
+                    stale.append(path)
+            except FileNotFoundError:
+                continue
+        if not stale:
+            return 0
+        # New epoch first, so a pruned key never reads as the version it had before
+        self._replace(self.directory / self.EPOCH, self.EPOCH)
+        for path in stale:
+            path.unlink(missing_ok=True)
+        return len(stale)
+
+
+class RepositoryGenerationStore:
+    """Per-key version counters kept in the database, shared by every replica
+
+    The repository bumps a key's version inside the transaction of the write
+    that changes it (see PostgresRepository), so bump() has nothing left to do.
+    """
+
+    # version() is a database round trip, so callers run it off the event loop
+    blocking = True
+
+    def __init__(self, repository):
+        self.repository = repository
+
+    def version(self, key: str) -> str:
+        return self.versions([key])[key]
+
+    def versions(self, keys: List[str]) -> Dict[str, str]:
+        return self.repository.cache_generations(keys)
+
+    def bump(self, key: str):
+        pass
+
+    def prune(self, max_age: float) -> int:
+        """Remove versions of keys not written for max_age seconds"""
+        return self.repository.prune_cache_generations(max_age)
+
+
+class ResponseCache:
+    """LRU of serialized responses validated against the key's generation
+
+    A cache key names the data (e.g. "votes:<vote_key>"); the variant names one
+    rendering of it (e.g. the page parameters of an image listing). Writers call
+    invalidate() after committing, which changes the ETag of every variant in
+    every worker. Entries older than max_age are rebuilt regardless, which also
+    covers generation files removed by GenerationStore.prune(). Not thread-safe:
+    use it from the event loop only.
+
+    max_entries bounds the stored bodies across all keys, max_variants those of
+    a single key, since variants are built from request parameters.
+    """
+
+    def __init__(
+        self,
+        generations: "GenerationStore | RepositoryGenerationStore",
+        max_entries: int = 10000,
+        max_variants: int = 8,
+        max_age: float = 3600.0,
+    ):
+        self.generations = generations
+        self.max_entries = max_entries
+        self.max_variants = max_variants
+        self.max_age = max_age
+        # key -> {variant: (etag, body, stored_at)}, least recently used key and variant first
+        self.entries: "OrderedDict[str, Dict[str, Tuple[str, bytes, float]]]" = OrderedDict()
+        self.size = 0  # stored bodies
+
+    @staticmethod
+    def make_etag(key: str, variant: str, version: str) -> str:
+        digest = hashlib.sha1(f"{key}|{variant}|{version}".encode()).hexdigest()[:20]
+        return f'W/"{digest}"'
+
+    def lookup(self, key: str, variant: str = "", version: Optional[str] = None) -> Tuple[str, Optional[bytes]]:
+        """Return the current ETag and the cached body, or None if it must be rebuilt
+
+        Read the ETag before loading data: a write racing with the rebuild then
+        leaves an entry that no longer matches and is rebuilt on the next request.
+        Pass version when the generation was already read, e.g. in a thread.
+        """
+        if version is None:
+            version = self.generations.version(key)
+        etag = self.make_etag(key, variant, version)
+        variants = self.entries.get(key)
+        if variants is None:
+            return etag, None
+        self.entries.move_to_end(key)
+        entry = variants.get(variant)
+        if entry is not None and entry[0] == etag and time.monotonic() - entry[2] < self.max_age:
+            variants[variant] = variants.pop(variant)
+            return etag, entry[1]
+        return etag, None
+
+    def store(self, key: str, variant: str, etag: str, body: bytes, stored_at: Optional[float] = None):
+        variants = self.entries.get(key)
+        if variants is None:
+            variants = self.entries[key] = {}
+        else:
+            self.entries.move_to_end(key)
+        if variants.pop(variant, None) is None:
+            self.size += 1
+            if len(variants) >= self.max_variants:
+                del variants[next(iter(variants))]
+                self.size -= 1
+        variants[variant] = (etag, body, time.monotonic() if stored_at is None else stored_at)
+        while self.size > self.max_entries and len(self.entries) > 1:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= len(evicted)
+
+    def invalidate(self, key: str):
+        try:
+            self.generations.bump(key)
+        except OSError as e:
+            # Without the bump other workers could serve stale data; drop our copies at least
+            logger.error(f"Failed to bump cache generation for {key}: {e}")
+        self.size -= len(self.entries.pop(key, {}))
+
+    def dump(self, path: Path, max_keys: int) -> int:
+        """Write the most recently used entries to path for load() after a restart"""
+        now = time.monotonic()
+        keys = list(reversed(self.entries))[:max_keys]
+        entries = []
+        for key in keys:
+            for variant, (etag, body, stored_at) in self.entries[key].items():
+                if now - stored_at < self.max_age:
+                    entries.append([key, variant, etag, body.decode("utf-8"), now - stored_at])
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        temp.write_text(json.dumps({"time": time.time(), "entries": entries}))
+        os.replace(temp, path)
+        return len(entries)
+
+    def load(self, path: Path) -> int:
+        """Restore entries written by dump() that are still current
+
+        An entry is only restored when its ETag matches the key's generation
+        now, so anything written while this worker was down is rebuilt instead.
+        """
+        try:
+            data = json.loads(path.read_text())
+        except FileNotFoundError:
+            return 0
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable cache snapshot {path}: {e}")
+            return 0
+
+        downtime = max(0.0, time.time() - data.get("time", 0))
+        entries = data.get("entries", [])
+        versions = self.generations.versions(list({entry[0] for entry in entries}))
+        now = time.monotonic()
+        restored = 0
+        # Oldest first, so the least recently used order survives the restart
+        for key, variant, etag, body, age in reversed(entries):
+            age += downtime
+            if age >= self.max_age or etag != self.make_etag(key, variant, versions[key]):
+                continue
+            self.store(key, variant, etag, body.encode("utf-8"), stored_at=now - age)
+            restored += 1
+        return restored
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against an ETag"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
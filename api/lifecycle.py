@@ -0,0 +1,126 @@
+"""
+Graceful shutdown for Eatinator
+Rejects new requests and waits for in-flight requests and streams, with a
+deadline, before the server closes its connections
+"""
+
+from typing import Optional
+import asyncio
+import json
+import logging
+import signal
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class Drainer:
+    """Counts in-flight requests and tracks the drain deadline
+
+    Draining starts on SIGTERM (see install_signal_handler) or, at the latest,
+    in the app's shutdown hook. Long responses such as AI streams can check
+    expired() to wrap up before the deadline instead of being cut off.
+    """
+
+    def __init__(self, timeout: float):
+        self.timeout = timeout
+        self.in_flight = 0
+        self.deadline: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def draining(self) -> bool:
+        return self.deadline is not None
+
+    def reset(self):
+        self.deadline = None
+        self.task = None
+
+    def begin(self):
+        if self.deadline is None:
+            self.deadline = time.monotonic() + self.timeout
+            logger.info(f"Draining {self.in_flight} in-flight request(s), deadline {self.timeout:.0f}s")
+
+    def remaining(self) -> float:
+        """Seconds left until the deadline (the full timeout if not draining)"""
+        if self.deadline is None:
+            return self.timeout
+        return max(0.0, self.deadline - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    async def wait(self) -> int:
+        """Drain until no request is in flight or the deadline passes; return how many are left"""
+        self.begin()
+        while self.in_flight and not self.expired():
+            await asyncio.sleep(0.05)
+        return self.in_flight
+
+    def install_signal_handler(self):
+        """Drain on SIGTERM first, then hand over to the server's own shutdown
+
+        uvicorn closes its listening sockets as soon as it sees SIGTERM. This
+        handler replaces it for SIGTERM only: while draining, new requests get
+        503 so load balancers and health checks move traffic away, then SIGINT
+        is raised, which uvicorn handles as a normal shutdown. Repeated SIGTERMs
+        (e.g. sent to the whole process group) are ignored; SIGINT (Ctrl+C) is
+        left to uvicorn.
+        """
+        if threading.current_thread() is not threading.main_thread():
+            # Signals can only be handled on the main thread (e.g. not under TestClient)
+            return
+        loop = asyncio.get_running_loop()
+
+        async def drain_then_exit():
+            left = await self.wait()
+            if left:
+                logger.warning(f"Drain deadline passed with {left} request(s) still in flight")
+            signal.raise_signal(signal.SIGINT)
+
+        def handle_sigterm():
+            if self.draining:
+                return
+            self.task = loop.create_task(drain_then_exit())
+
+        try:
+            loop.add_signal_handler(signal.SIGTERM, handle_sigterm)
+        except (NotImplementedError, RuntimeError):
+            # Windows event loops don't support signal handlers
+            pass
+
+
+class DrainMiddleware:
+    """ASGI middleware counting in-flight requests and rejecting new ones while draining"""
+
+    def __init__(self, app, drainer: Drainer, retry_after: int = 5):
+        self.app = app
+        self.drainer = drainer
+        self.retry_after = retry_after
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        if self.drainer.draining:
+            body = json.dumps({"status": "draining", "error": "Server is restarting, please retry"}).encode()
+            await send({
+                "type": "http.response.start",
+                "status": 503,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"retry-after", str(self.retry_after).encode()),
+                    (b"connection", b"close"),
+                ],
+            })
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        self.drainer.in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.drainer.in_flight -= 1
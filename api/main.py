@@ -3,42 +3,78 @@ FastAPI backend for Eatinator
 Replaces PHP implementation with Python FastAPI + SQLite
 """
 
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Query, Request
-from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from fastapi import APIRouter, FastAPI, UploadFile, File, Form, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-import sqlite3
 import os
 import time
 import uuid
 import hashlib
 from pathlib import Path
 from typing import Optional, List
-import shutil
 import mimetypes
-from PIL import Image
 import logging
-import requests
 import json
 import asyncio
+import contextvars
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from bodylimit import BodySizeLimitMiddleware
+from cache import GenerationStore, RepositoryGenerationStore, ResponseCache, etag_matches
+from lifecycle import DrainMiddleware, Drainer
+from profiling import ProfileRing, ProfilingMiddleware, StackSampler, record_phase
+from metrics import InstrumentedProxy, MetricsMiddleware, MetricsRegistry
+from ratelimit import RateLimitMiddleware, RateLimitPolicy, create_rate_limiter
+from repository import VoteRejected, create_repository, repository_class, decode_image_cursor, images_cache_key, votes_cache_key
+from storage import create_image_storage
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="Eatinator API", version="1.0.0")
+class TimedJSONResponse(JSONResponse):
+    """JSON response that reports its rendering time as the serialization phase"""
+    
+    def render(self, content) -> bytes:
+        start = time.perf_counter()
+        try:
+            return super().render(content)
+        finally:
+            record_phase("serialization", time.perf_counter() - start)
 
-# Add CORS middleware
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+class LazyBackend:
+    """Builds the wrapped backend on first use instead of at import
+    
+    Keeps `import main` from loading boto3 or psycopg and from opening a
+    connection pool; the repository is first used by init_db() at startup.
+    """
+    
+    def __init__(self, factory):
+        object.__setattr__(self, "_factory", factory)
+        object.__setattr__(self, "_target", None)
+        object.__setattr__(self, "_lock", threading.Lock())
+    
+    def _get(self):
+        # Also reached from worker threads (asyncio.to_thread, image_executor)
+        if self._target is None:
+            with self._lock:
+                if self._target is None:
+                    object.__setattr__(self, "_target", self._factory())
+        return self._target
+    
+    def __getattr__(self, name: str):
+        return getattr(self._get(), name)
+    
+    def __setattr__(self, name: str, value):
+        setattr(self._get(), name, value)
+
+# Routes are declared on a module-level router and handed to each app built by create_app()
+router = APIRouter(default_response_class=TimedJSONResponse)
 
 # Configuration
-DATA_DIR = Path(__file__).parent / "data"
+DATA_DIR = Path(os.getenv('DATA_DIR', str(Path(__file__).parent / "data")))
 IMAGES_DIR = DATA_DIR / "images"
 DB_PATH = DATA_DIR / "eatinator.db"
 MAX_FILE_SIZE = 15 * 1024 * 1024  # 15MB
@@ -46,24 +82,117 @@ ALLOWED_TYPES = ["image/jpeg", "image/png", "image/webp"]
 ALLOWED_EXTENSIONS = ["jpg", "jpeg", "png", "webp"]
 RETENTION_HOURS = 24
 MAX_VOTES_PER_USER = 10
+DEFAULT_IMAGE_PAGE_SIZE = 50
+MAX_IMAGE_PAGE_SIZE = 200
+CLEANUP_INTERVAL_SECONDS = 60  # retention cleanup runs at most this often per worker
+MAX_BATCH_FILES = 10
+MAX_BATCH_TOTAL_SIZE = 50 * 1024 * 1024  # 50MB per batch request
+MAX_BATCH_BODY_SIZE = MAX_BATCH_TOTAL_SIZE + 1024 * 1024  # plus room for multipart headers and form fields
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', '4'))  # threads validating and storing batch uploads
 
 # Cloudflare Turnstile Configuration
 TURNSTILE_SECRET_KEY = os.getenv('TURNSTILE_SECRET_KEY', '')
 TURNSTILE_ENABLED = bool(TURNSTILE_SECRET_KEY)
-TURNSTILE_VERIFY_URL = "https://challenges.cloudflare.com/turnstile/v0/siteverify"
+TURNSTILE_VERIFY_URL = os.getenv('TURNSTILE_VERIFY_URL', "https://challenges.cloudflare.com/turnstile/v0/siteverify")
 
 # AI Configuration - Only mlvoca with deepseek as requested
 AI_CONFIG = {
-    'url': 'https://mlvoca.com/api/generate',
+    'url': os.getenv('AI_API_URL', 'https://mlvoca.com/api/generate'),
     'model': 'deepseek-r1:1.5b',
     'max_tokens': 300,
     'temperature': 0.7,
     'timeout': 60  # Increased to 60 seconds for AI processing
 }
 
-# Create directories
-DATA_DIR.mkdir(exist_ok=True)
-IMAGES_DIR.mkdir(exist_ok=True)
+# Rate limiting: token buckets per client and route, first matching policy wins
+# Off unless enabled: behind a proxy, set RATE_LIMIT_TRUSTED_PROXIES too or every user shares one bucket
+RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+RATE_LIMIT_BACKEND = os.getenv('RATE_LIMIT_BACKEND', 'memory').lower()  # memory | sqlite (shared by workers)
+RATE_LIMIT_TRUSTED_PROXIES = [proxy for proxy in os.getenv('RATE_LIMIT_TRUSTED_PROXIES', '').split(',') if proxy.strip()]
+RATE_LIMIT_POLICIES = [
+    RateLimitPolicy("ai", ("POST",), ("/api/ai",), rate=0.2, burst=5),
+    RateLimitPolicy("image_upload", ("POST",), ("/api/images",), rate=0.1, burst=5),
+    RateLimitPolicy("vote", ("POST",), ("/api/votes",), rate=1.0, burst=10),
+    RateLimitPolicy("read", ("GET",), ("/api/votes", "/api/images"), rate=20.0, burst=100),
+]
+
+# Response cache for vote and image listings; point CACHE_GENERATIONS_DIR at a directory
+# shared by all workers (the default under DATA_DIR is) so writes invalidate everywhere.
+# With the postgres backend the generations live in the database instead, shared by every replica
+CACHE_GENERATIONS_DIR = Path(os.getenv('CACHE_GENERATIONS_DIR', str(DATA_DIR / "cache_generations")))
+CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', '10000'))
+CACHE_GENERATION_MAX_AGE = 7 * 24 * 3600  # generation files of untouched keys are pruned after a week
+
+# Graceful shutdown: in-flight requests and AI streams get DRAIN_TIMEOUT seconds to finish,
+# then the most recently used cache entries are saved to WARM_STATE_PATH for the next start
+DRAIN_TIMEOUT = float(os.getenv('DRAIN_TIMEOUT', '20'))
+WARM_STATE_PATH = Path(os.getenv('WARM_STATE_PATH', str(DATA_DIR / "warm_state.json")))
+WARM_STATE_MAX_KEYS = int(os.getenv('WARM_STATE_MAX_KEYS', '2000'))
+
+# Metrics: set METRICS_DIR to a directory shared by all uvicorn workers to aggregate them
+METRICS_DIR = os.getenv('METRICS_DIR', '')
+METRICS_FLUSH_INTERVAL = 5  # seconds between per-worker snapshots
+
+# Profiling: requests sending "X-Profile: <PROFILE_SECRET>" or picked by PROFILE_SAMPLE_RATE
+# are profiled into PROFILE_DIR; requests slower than SLOW_REQUEST_THRESHOLD_MS are logged
+PROFILE_SECRET = os.getenv('PROFILE_SECRET', '')
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_DIR = Path(os.getenv('PROFILE_DIR', str(DATA_DIR / "profiles")))
+PROFILE_RING_SIZE = int(os.getenv('PROFILE_RING_SIZE', '50'))
+SLOW_REQUEST_THRESHOLD_MS = float(os.getenv('SLOW_REQUEST_THRESHOLD_MS', '1000'))
+
+# Subsystem label (see SUBSYSTEM_DURATION) -> phase in slow-request breakdowns
+SUBSYSTEM_PHASES = {
+    "db": "db",
+    "storage": "file_io",
+    "image": "image",
+    "upstream": "upstream_http",
+}
+
+# Metrics (see metrics.py)
+metrics_registry = MetricsRegistry(Path(METRICS_DIR) if METRICS_DIR else None)
+REQUEST_DURATION = metrics_registry.histogram(
+    "eatinator_http_request_duration_seconds", "HTTP request duration", ("method", "route", "status")
+)
+REQUESTS_IN_FLIGHT = metrics_registry.gauge(
+    "eatinator_http_requests_in_flight", "HTTP requests currently being served", ("method", "route")
+)
+SUBSYSTEM_DURATION = metrics_registry.histogram(
+    "eatinator_subsystem_duration_seconds", "Time spent in database, storage, image and upstream calls", ("subsystem", "operation")
+)
+UPSTREAM_ERRORS = metrics_registry.counter(
+    "eatinator_upstream_errors_total", "Failed calls to upstream services", ("service",)
+)
+RESPONSE_CACHE_REQUESTS = metrics_registry.counter(
+    "eatinator_response_cache_requests_total", "Cached listing requests by outcome", ("namespace", "result")
+)
+AI_TIME_TO_FIRST_TOKEN = metrics_registry.histogram(
+    "eatinator_ai_time_to_first_token_seconds", "Time from AI request to the first streamed chunk"
+)
+SUBSYSTEM_DURATION.listeners.append(
+    lambda seconds, labels: record_phase(SUBSYSTEM_PHASES.get(labels[0], labels[0]), seconds)
+)
+
+# Image storage backend (local disk by default, see storage.py), created on first use
+image_storage = LazyBackend(
+    lambda: InstrumentedProxy(create_image_storage(IMAGES_DIR), SUBSYSTEM_DURATION, "storage")
+)
+
+# Persistence backend (SQLite by default, see repository.py), created on first use
+repository = LazyBackend(lambda: InstrumentedProxy(create_repository(DB_PATH), SUBSYSTEM_DURATION, "db"))
+
+# Serialized vote and image listings, invalidated on writes (see cache.py)
+if repository_class().shared_cache_generations:
+    cache_generations = RepositoryGenerationStore(repository)
+else:
+    cache_generations = GenerationStore(CACHE_GENERATIONS_DIR)
+response_cache = ResponseCache(cache_generations, max_entries=CACHE_MAX_ENTRIES)
+
+# In-flight request tracking for graceful shutdown (see lifecycle.py)
+drainer = Drainer(DRAIN_TIMEOUT)
+
+# Validation and storage of batch uploads, bounded so a large batch can't take every default thread
+image_executor = ThreadPoolExecutor(max_workers=IMAGE_WORKERS, thread_name_prefix="image")
 
 # Pydantic models
 class VoteRequest(BaseModel):
@@ -97,91 +226,85 @@ class AiResponse(BaseModel):
 
 # Database initialization
 def init_db():
-    """Initialize SQLite database with required tables"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    # Votes table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS votes (
-            vote_key TEXT PRIMARY KEY,
-            good INTEGER DEFAULT 0,
-            neutral INTEGER DEFAULT 0,
-            bad INTEGER DEFAULT 0,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # User votes tracking table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS user_votes (
-            user_id TEXT,
-            vote_key TEXT,
-            vote_type TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            PRIMARY KEY (user_id, vote_key)
-        )
-    ''')
-    
-    # Image metadata table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS images (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            dish_key TEXT,
-            filename TEXT,
-            original_name TEXT,
-            file_path TEXT,
-            upload_time INTEGER,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    conn.commit()
-    conn.close()
+    """Create tables and apply pending migrations"""
+    repository.init_schema()
 
 # Utility functions
 def sanitize_key(key: str) -> str:
     """Sanitize keys to prevent path traversal"""
     return "".join(c if c.isalnum() or c in "_-" else "_" for c in key)
 
-def get_db_connection():
-    """Get database connection"""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+def parse_image_cursor(cursor: Optional[str]) -> Optional[tuple]:
+    """Parse a pagination cursor from a query string"""
+    if not cursor:
+        return None
+    try:
+        return decode_image_cursor(cursor)
+    except ValueError:
+        raise HTTPException(400, "Invalid cursor")
 
-def cleanup_old_images():
-    """Remove images older than retention period"""
+def cleanup_old_images() -> set:
+    """Remove images older than retention period and return the affected dish keys"""
     try:
         cutoff_time = time.time() - (RETENTION_HOURS * 3600)
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Find old images
-        cursor.execute(
-            "SELECT file_path FROM images WHERE upload_time < ?",
-            (cutoff_time,)
-        )
-        old_images = cursor.fetchall()
         
-        # Delete files and database records
-        for image in old_images:
-            file_path = Path(image["file_path"])
-            if file_path.exists():
-                file_path.unlink()
+        # Delete database records, then the files they pointed to
+        old_images = repository.delete_images_before(cutoff_time)
+        image_storage.delete_many(file_path for _, file_path in old_images)
         
-        cursor.execute(
-            "DELETE FROM images WHERE upload_time < ?",
-            (cutoff_time,)
-        )
-        
-        conn.commit()
-        conn.close()
+        response_cache.generations.prune(CACHE_GENERATION_MAX_AGE)
         
         logger.info(f"Cleaned up {len(old_images)} old images")
+        return {dish_key for dish_key, _ in old_images}
     except Exception as e:
         logger.error(f"Error cleaning up old images: {e}")
+        return set()
+
+_last_cleanup = 0.0
+
+async def maybe_cleanup_old_images():
+    """Run retention cleanup at most once per CLEANUP_INTERVAL_SECONDS"""
+    global _last_cleanup
+    now = time.monotonic()
+    if now - _last_cleanup < CLEANUP_INTERVAL_SECONDS:
+        return
+    _last_cleanup = now
+    dish_keys = await asyncio.to_thread(cleanup_old_images)
+    # ResponseCache is not thread-safe, so invalidate on the event loop
+    for dish_key in dish_keys:
+        response_cache.invalidate(images_cache_key(dish_key))
+
+def render_json(content) -> bytes:
+    """Serialize like JSONResponse does"""
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+async def cached_json_response(request: Request, key: str, variant: str, build) -> Response:
+    """Serve a listing from the response cache, revalidating with ETag / If-None-Match
+    
+    build is an async callable returning the content; it only runs on a cache miss.
+    """
+    namespace = key.split(":", 1)[0]
+    version = None
+    if response_cache.generations.blocking:
+        version = await asyncio.to_thread(response_cache.generations.version, key)
+    etag, body = response_cache.lookup(key, variant, version)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        RESPONSE_CACHE_REQUESTS.inc(namespace, "not_modified")
+        return Response(status_code=304, headers=headers)
+    
+    if body is None:
+        RESPONSE_CACHE_REQUESTS.inc(namespace, "miss")
+        content = await build()
+        start = time.perf_counter()
+        body = render_json(content)
+        record_phase("serialization", time.perf_counter() - start)
+        response_cache.store(key, variant, etag, body)
+    else:
+        RESPONSE_CACHE_REQUESTS.inc(namespace, "hit")
+    
+    return Response(body, media_type="application/json", headers=headers)
 
 async def verify_turnstile_token(token: str, remote_ip: str = None) -> bool:
     """Verify Cloudflare Turnstile token"""
@@ -191,6 +314,7 @@ async def verify_turnstile_token(token: str, remote_ip: str = None) -> bool:
     if not token:
         return False
     
+    import requests  # heavy import, deferred to first use to keep cold starts fast
     try:
         data = {
             'secret': TURNSTILE_SECRET_KEY,
@@ -199,19 +323,22 @@ async def verify_turnstile_token(token: str, remote_ip: str = None) -> bool:
         if remote_ip:
             data['remoteip'] = remote_ip
         
-        response = requests.post(
-            TURNSTILE_VERIFY_URL,
-            data=data,
-            timeout=5
-        )
+        with SUBSYSTEM_DURATION.time("upstream", "turnstile"):
+            response = requests.post(
+                TURNSTILE_VERIFY_URL,
+                data=data,
+                timeout=5
+            )
         
         if response.status_code == 200:
             result = response.json()
             return result.get('success', False)
         else:
+            UPSTREAM_ERRORS.inc("turnstile")
             logger.warning(f"Turnstile verification failed with status: {response.status_code}")
             return False
     except Exception as e:
+        UPSTREAM_ERRORS.inc("turnstile")
         logger.error(f"Error verifying Turnstile token: {e}")
         return False
 
@@ -221,30 +348,53 @@ def validate_image_file(file: UploadFile) -> str:
     if file.content_type not in ALLOWED_TYPES:
         raise HTTPException(400, "Invalid file type. Only JPEG, PNG, and WebP are allowed")
     
-    # Save to temporary file for validation
-    temp_path = IMAGES_DIR / f"temp_{uuid.uuid4().hex}"
+    from PIL import Image  # heavy import, deferred to the first upload
+    
+    # Validate with PIL straight from the spooled upload, no temporary copy
     try:
-        with temp_path.open("wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        # Validate with PIL
-        with Image.open(temp_path) as img:
+        with Image.open(file.file) as img:
             format_map = {
                 "JPEG": "jpg",
                 "PNG": "png",
                 "WEBP": "webp"
             }
             safe_extension = format_map.get(img.format)
-            if not safe_extension or safe_extension not in ALLOWED_EXTENSIONS:
-                raise HTTPException(400, "Unsupported image format")
-        
+    except (OSError, SyntaxError, ValueError):
+        # UnidentifiedImageError is an OSError; truncated headers raise the others
+        raise HTTPException(400, "Unsupported image format")
+    finally:
         # Reset file pointer for later use
         file.file.seek(0)
-        return safe_extension
     
-    finally:
-        if temp_path.exists():
-            temp_path.unlink()
+    if not safe_extension or safe_extension not in ALLOWED_EXTENSIONS:
+        raise HTTPException(400, "Unsupported image format")
+    return safe_extension
+
+def generate_image_filename(key: str, safe_extension: str) -> tuple:
+    """Return a unique stored filename and its upload timestamp"""
+    upload_time = int(time.time())
+    unique_id = hashlib.md5(f"{key}_{upload_time}_{uuid.uuid4().hex}".encode()).hexdigest()[:8]
+    return f"{upload_time}_{unique_id}.{safe_extension}", upload_time
+
+def store_batch_image(key: str, image: UploadFile) -> tuple:
+    """Validate and store one file of a batch upload; runs in the image pool"""
+    with SUBSYSTEM_DURATION.time("image", "validate"):
+        safe_extension = validate_image_file(image)
+    filename, upload_time = generate_image_filename(key, safe_extension)
+    file_path = image_storage.save(
+        sanitize_key(key),
+        filename,
+        image.file,
+        mimetypes.guess_type(filename)[0] or "image/jpeg"
+    )
+    return (key, filename, image.filename, file_path, upload_time)
+
+async def run_in_image_pool(func, *args):
+    """Run func in the image worker pool, keeping the request context for phase timings"""
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(
+        image_executor, functools.partial(context.run, func, *args)
+    )
 
 def get_system_prompt(context: dict) -> str:
     """Generate system prompt with menu context"""
@@ -304,6 +454,7 @@ Respond briefly (1-3 sentences), friendly and practical. No menu lists - just ad
 
 async def call_ai_api(message: str, context: dict) -> str:
     """Call the mlvoca AI API with the message and context"""
+    import requests
     try:
         system_prompt = get_system_prompt(context)
         
@@ -317,12 +468,15 @@ async def call_ai_api(message: str, context: dict) -> str:
             }
         }
         
-        response = requests.post(
-            AI_CONFIG['url'],
-            headers={'Content-Type': 'application/json'},
-            json=payload,
-            timeout=AI_CONFIG['timeout']
-        )
+        with SUBSYSTEM_DURATION.time("upstream", "ai_generate"):
+            # Off the event loop: generations take seconds and would stall every other request
+            response = await asyncio.to_thread(
+                requests.post,
+                AI_CONFIG['url'],
+                headers={'Content-Type': 'application/json'},
+                json=payload,
+                timeout=AI_CONFIG['timeout']
+            )
         
         if response.ok:
             data = response.json()
@@ -335,9 +489,11 @@ async def call_ai_api(message: str, context: dict) -> str:
             raise Exception(f"AI API responded with status {response.status_code}: {response.text}")
         
     except requests.exceptions.Timeout:
+        UPSTREAM_ERRORS.inc("ai")
         logger.error("AI API timeout")
         raise Exception("AI request timed out - the service may be overloaded. Please try again.")
     except requests.exceptions.ConnectionError:
+        UPSTREAM_ERRORS.inc("ai")
         logger.error("AI API connection error")
         raise Exception("Could not connect to AI service. Please check your internet connection.")
     except Exception as e:
@@ -346,6 +502,9 @@ async def call_ai_api(message: str, context: dict) -> str:
 
 async def stream_ai_api(message: str, context: dict):
     """Stream AI API response"""
+    import requests
+    start = time.perf_counter()
+    first_chunk = True
     try:
         system_prompt = get_system_prompt(context)
         
@@ -359,19 +518,31 @@ async def stream_ai_api(message: str, context: dict):
             }
         }
         
-        # Use streaming request
-        with requests.post(
+        # Use streaming request, opened and read in worker threads so the event loop
+        # keeps serving other requests (and handling shutdown) while the model generates
+        response = await asyncio.to_thread(
+            requests.post,
             AI_CONFIG['url'],
             headers={'Content-Type': 'application/json'},
             json=payload,
             timeout=AI_CONFIG['timeout'],
             stream=True
-        ) as response:
+        )
+        with response:
             if not response.ok:
                 raise Exception(f"AI API responded with status {response.status_code}: {response.text}")
             
-            # Stream the response
-            for line in response.iter_lines(decode_unicode=True):
+            # Stream the response; the default 512-byte reads would hold back the first
+            # lines (and AI_TIME_TO_FIRST_TOKEN) until several tokens have arrived
+            lines = response.iter_lines(chunk_size=1, decode_unicode=True)
+            while True:
+                line = await asyncio.to_thread(next, lines, None)
+                if line is None:
+                    break
+                if drainer.expired():
+                    # End cleanly before the server closes the connection on shutdown
+                    yield f"data: {json.dumps({'error': 'The server is restarting. Please ask again.'})}\n\n"
+                    break
                 if line:
                     try:
                         # Parse streaming JSON response
@@ -379,6 +550,9 @@ async def stream_ai_api(message: str, context: dict):
                         if 'response' in data:
                             chunk = data['response']
                             if chunk:
+                                if first_chunk:
+                                    AI_TIME_TO_FIRST_TOKEN.observe(time.perf_counter() - start)
+                                    first_chunk = False
                                 yield f"data: {json.dumps({'chunk': chunk})}\n\n"
                         elif data.get('done'):
                             # End of stream
@@ -389,14 +563,18 @@ async def stream_ai_api(message: str, context: dict):
                         continue
                         
     except requests.exceptions.Timeout:
+        UPSTREAM_ERRORS.inc("ai")
         logger.error("AI API timeout")
         yield f"data: {json.dumps({'error': 'AI request timed out - the service may be overloaded. Please try again.'})}\n\n"
     except requests.exceptions.ConnectionError:
+        UPSTREAM_ERRORS.inc("ai")
         logger.error("AI API connection error")
         yield f"data: {json.dumps({'error': 'Could not connect to AI service. Please check your internet connection.'})}\n\n"
     except Exception as e:
         logger.error(f"AI API streaming error: {e}")
         yield f"data: {json.dumps({'error': str(e)})}\n\n"
+    finally:
+        SUBSYSTEM_DURATION.observe(time.perf_counter() - start, "upstream", "ai_stream")
 
 def get_fallback_response(message: str, context: dict) -> str:
     """Generate fallback response when AI API is unavailable"""
@@ -409,38 +587,80 @@ def get_fallback_response(message: str, context: dict) -> str:
     else:
         return 'Sorry, the AI assistant is currently unavailable. I\'m happy to help with menu recommendations, allergy questions, or dietary advice! What interests you most?'
 
-# Initialize database on startup
-@app.on_event("startup")
+# Tasks started at startup; referenced here so they aren't garbage collected while running
+background_tasks = set()
+
+def start_background_task(coro, name: Optional[str] = None):
+    task = asyncio.create_task(coro, name=name)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+
+# Initialize database on startup; retention cleanup runs after the app starts serving
 async def startup_event():
+    drainer.reset()
+    drainer.install_signal_handler()
     init_db()
-    cleanup_old_images()
+    
+    # Serve the listings that were hot before the restart from memory right away
+    restored = await asyncio.to_thread(response_cache.load, WARM_STATE_PATH)
+    if restored:
+        logger.info(f"Restored {restored} cached responses from {WARM_STATE_PATH}")
+    
+    start_background_task(maybe_cleanup_old_images())
+    if metrics_registry.multiprocess_dir:
+        start_background_task(flush_metrics_periodically(), name="metrics-flush")
+
+async def shutdown_event():
+    # Usually drained already on SIGTERM; this covers servers that never sent it
+    left = await drainer.wait()
+    if left:
+        logger.warning(f"Shutting down with {left} request(s) still in flight")
+    
+    # Flush pending writes: let a running retention cleanup finish, then save warm state
+    for task in background_tasks:
+        if task.get_name() == "metrics-flush":
+            task.cancel()
+    if background_tasks:
+        await asyncio.wait(list(background_tasks), timeout=max(drainer.remaining(), 1.0))
+    try:
+        saved = await asyncio.to_thread(response_cache.dump, WARM_STATE_PATH, WARM_STATE_MAX_KEYS)
+        logger.info(f"Saved {saved} cached responses to {WARM_STATE_PATH}")
+    except OSError as e:
+        logger.warning(f"Failed to save cache snapshot: {e}")
+    
+    repository.close()
+    metrics_registry.write_snapshot()
+
+async def flush_metrics_periodically():
+    """Publish this worker's metrics so any worker can serve the aggregate"""
+    while True:
+        await asyncio.sleep(METRICS_FLUSH_INTERVAL)
+        try:
+            metrics_registry.write_snapshot()
+        except OSError as e:
+            logger.warning(f"Failed to write metrics snapshot: {e}")
+
+# Prometheus metrics endpoint
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    metrics_registry.write_snapshot()
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4")
 
 # Health check endpoint
-@app.get("/health")
+@router.get("/health")
 async def health_check():
     return {"status": "healthy", "service": "eatinator-api"}
 
 # REST-compliant voting endpoints
-@app.get("/api/votes/{vote_key}")
-async def get_votes_rest(vote_key: str):
+@router.get("/api/votes/{vote_key}")
+async def get_votes_rest(vote_key: str, request: Request):
     """Get votes for a specific key (REST endpoint)"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        async def build():
+            votes = await asyncio.to_thread(repository.get_votes, vote_key)
+            return {"success": True, "votes": votes}
         
-        cursor.execute(
-            "SELECT good, neutral, bad FROM votes WHERE vote_key = ?",
-            (vote_key,)
-        )
-        result = cursor.fetchone()
-        conn.close()
-        
-        if result:
-            votes = {"good": result["good"], "neutral": result["neutral"], "bad": result["bad"]}
-        else:
-            votes = {"good": 0, "neutral": 0, "bad": 0}
-        
-        return {"success": True, "votes": votes}
+        return await cached_json_response(request, votes_cache_key(vote_key), "", build)
     
     except Exception as e:
         logger.error(f"Error getting votes: {e}")
@@ -452,7 +672,7 @@ class RestVoteRequest(BaseModel):
     userId: str
     turnstileToken: Optional[str] = None
 
-@app.post("/api/votes")
+@router.post("/api/votes")
 async def cast_vote_rest(vote_request: RestVoteRequest, request: Request):
     """Cast a vote (REST endpoint)"""
     try:
@@ -468,57 +688,18 @@ async def cast_vote_rest(vote_request: RestVoteRequest, request: Request):
         if vote_request.voteType not in ["good", "neutral", "bad"]:
             raise HTTPException(400, "Invalid vote type")
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Check if user already voted for this item
-        cursor.execute(
-            "SELECT 1 FROM user_votes WHERE user_id = ? AND vote_key = ?",
-            (vote_request.userId, vote_request.key)
-        )
-        if cursor.fetchone():
-            conn.close()
-            raise HTTPException(400, "User has already voted for this item")
-        
-        # Check vote limit per user
-        cursor.execute(
-            "SELECT COUNT(*) as count FROM user_votes WHERE user_id = ?",
-            (vote_request.userId,)
-        )
-        user_vote_count = cursor.fetchone()["count"]
-        if user_vote_count >= MAX_VOTES_PER_USER:
-            conn.close()
-            raise HTTPException(400, "Vote limit exceeded")
-        
-        # Insert or update vote counts
-        cursor.execute(
-            "INSERT OR IGNORE INTO votes (vote_key) VALUES (?)",
-            (vote_request.key,)
-        )
-        
-        cursor.execute(f'''
-            UPDATE votes 
-            SET {vote_request.voteType} = {vote_request.voteType} + 1,
-                updated_at = CURRENT_TIMESTAMP
-            WHERE vote_key = ?
-        ''', (vote_request.key,))
-        
-        # Record user vote
-        cursor.execute(
-            "INSERT INTO user_votes (user_id, vote_key, vote_type) VALUES (?, ?, ?)",
-            (vote_request.userId, vote_request.key, vote_request.voteType)
-        )
-        
-        # Get updated votes
-        cursor.execute(
-            "SELECT good, neutral, bad FROM votes WHERE vote_key = ?",
-            (vote_request.key,)
-        )
-        result = cursor.fetchone()
-        votes = {"good": result["good"], "neutral": result["neutral"], "bad": result["bad"]}
+        try:
+            votes = await asyncio.to_thread(
+                repository.cast_vote,
+                vote_request.userId,
+                vote_request.key,
+                vote_request.voteType,
+                MAX_VOTES_PER_USER
+            )
+        except VoteRejected as e:
+            raise HTTPException(400, str(e))
         
-        conn.commit()
-        conn.close()
+        response_cache.invalidate(votes_cache_key(vote_request.key))
         
         return {"success": True, "votes": votes}
     
@@ -529,12 +710,12 @@ async def cast_vote_rest(vote_request: RestVoteRequest, request: Request):
         raise HTTPException(400, f"Failed to save vote: {str(e)}")
 
 # Legacy PHP-style voting endpoints (for backward compatibility)
-@app.get("/api/votes.php")
-async def get_votes(key: str = Query(..., description="Vote key")):
+@router.get("/api/votes.php")
+async def get_votes(request: Request, key: str = Query(..., description="Vote key")):
     """Get votes for a specific key (legacy endpoint)"""
-    return await get_votes_rest(key)
+    return await get_votes_rest(key, request)
 
-@app.post("/api/votes.php")
+@router.post("/api/votes.php")
 async def cast_vote(vote_request: VoteRequest, request: Request):
     """Cast a vote (legacy endpoint)"""
     try:
@@ -557,63 +738,67 @@ async def cast_vote(vote_request: VoteRequest, request: Request):
         raise HTTPException(400, f"Failed to save vote: {str(e)}")
 
 # REST-compliant image endpoints
-@app.get("/api/images/{image_key}")
-async def get_images_rest(image_key: str):
-    """Get images for a dish (REST endpoint)"""
+@router.get("/api/images/{image_key}")
+async def get_images_rest(
+    image_key: str,
+    request: Request,
+    limit: int = Query(DEFAULT_IMAGE_PAGE_SIZE, ge=1, le=MAX_IMAGE_PAGE_SIZE, description="Page size"),
+    before: Optional[str] = Query(None, description="Cursor returned as nextCursor by the previous page")
+):
+    """Get images for a dish, newest first, paginated by cursor (REST endpoint)"""
     try:
-        # Clean up old images on every request
-        cleanup_old_images()
-        
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT filename, original_name, upload_time, file_path
-            FROM images 
-            WHERE dish_key = ? AND file_path IS NOT NULL
-            ORDER BY upload_time DESC
-        ''', (image_key,))
-        
-        results = cursor.fetchall()
-        conn.close()
-        
-        images = []
-        for row in results:
-            # Verify file still exists
-            if Path(row["file_path"]).exists():
-                images.append({
-                    "filename": row["filename"],
-                    "originalName": row["original_name"],
-                    "uploadTime": row["upload_time"],
-                    "timestamp": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(row["upload_time"])),
-                    "url": f"/api/images/{image_key}/{row['filename']}"
-                })
-        
-        return {"success": True, "images": images}
+        # Clean up old images (throttled; invalidates listings it changes)
+        await maybe_cleanup_old_images()
+        
+        cursor = parse_image_cursor(before)
+        
+        async def build():
+            results, next_cursor = await asyncio.to_thread(
+                repository.list_images, image_key, limit, cursor
+            )
+            
+            images = []
+            for row in results:
+                # Verify file still exists
+                if image_storage.exists(row["file_path"]):
+                    images.append({
+                        "filename": row["filename"],
+                        "originalName": row["original_name"],
+                        "uploadTime": row["upload_time"],
+                        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(row["upload_time"])),
+                        "url": f"/api/images/{image_key}/{row['filename']}"
+                    })
+            
+            return {"success": True, "images": images, "nextCursor": next_cursor}
+        
+        # Only first pages are cached; cursors are client input and would fill the cache
+        if cursor is not None:
+            return await build()
+        return await cached_json_response(request, images_cache_key(image_key), str(limit), build)
     
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error getting images: {e}")
         raise HTTPException(400, f"Failed to get images: {str(e)}")
 
-@app.get("/api/images/{image_key}/{filename}")
+@router.get("/api/images/{image_key}/{filename}")
 async def get_image_file_rest(image_key: str, filename: str):
     """Serve a specific image file (REST endpoint)"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute(
-            "SELECT file_path FROM images WHERE dish_key = ? AND filename = ?",
-            (image_key, filename)
-        )
-        result = cursor.fetchone()
-        conn.close()
-        
-        if not result or not Path(result["file_path"]).exists():
+        file_path = await asyncio.to_thread(repository.get_image_path, image_key, filename)
+        if not file_path:
             raise HTTPException(404, "Image not found")
         
-        return FileResponse(
-            result["file_path"],
-            media_type=mimetypes.guess_type(filename)[0] or "image/jpeg"
+        response = await asyncio.to_thread(
+            image_storage.response,
+            file_path,
+            mimetypes.guess_type(filename)[0] or "image/jpeg"
         )
+        if response is None:
+            raise HTTPException(404, "Image not found")
+        
+        return response
     
     except HTTPException:
         raise
@@ -624,7 +809,7 @@ async def get_image_file_rest(image_key: str, filename: str):
 class RestImageUpload(BaseModel):
     key: str
 
-@app.post("/api/images")
+@router.post("/api/images")
 async def upload_image_rest(
     request: Request,
     key: str = Form(..., description="Image key"),
@@ -647,33 +832,27 @@ async def upload_image_rest(
             raise HTTPException(400, "File too large. Maximum size is 15MB")
         
         # Validate image
-        safe_extension = validate_image_file(image)
+        with SUBSYSTEM_DURATION.time("image", "validate"):
+            safe_extension = validate_image_file(image)
         
         # Generate unique filename
-        upload_time = int(time.time())
-        unique_id = hashlib.md5(f"{key}_{upload_time}_{uuid.uuid4().hex}".encode()).hexdigest()[:8]
-        filename = f"{upload_time}_{unique_id}.{safe_extension}"
-        
-        # Create dish-specific directory
-        dish_dir = IMAGES_DIR / sanitize_key(key)
-        dish_dir.mkdir(exist_ok=True)
-        
-        file_path = dish_dir / filename
+        filename, upload_time = generate_image_filename(key, safe_extension)
         
-        # Save file
-        with file_path.open("wb") as buffer:
-            shutil.copyfileobj(image.file, buffer)
+        # Save file under a dish-specific directory/prefix (off the event loop, may hit the network)
+        file_path = await asyncio.to_thread(
+            image_storage.save,
+            sanitize_key(key),
+            filename,
+            image.file,
+            mimetypes.guess_type(filename)[0] or "image/jpeg"
+        )
         
         # Save metadata to database
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO images (dish_key, filename, original_name, file_path, upload_time)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (key, filename, image.filename, str(file_path), upload_time))
+        await asyncio.to_thread(
+            repository.add_image, key, filename, image.filename, file_path, upload_time
+        )
         
-        conn.commit()
-        conn.close()
+        response_cache.invalidate(images_cache_key(key))
         
         logger.info(f"Image uploaded: {filename} for dish {key}")
         
@@ -689,12 +868,83 @@ async def upload_image_rest(
         logger.error(f"Error uploading image: {e}")
         raise HTTPException(400, f"Failed to save image: {str(e)}")
 
+@router.post("/api/images/batch")
+async def upload_images_batch(
+    request: Request,
+    key: str = Form(..., description="Image key"),
+    images: List[UploadFile] = File(..., description="Image files"),
+    turnstileToken: Optional[str] = Form(None, description="Turnstile token")
+):
+    """Upload several images for a dish in one request"""
+    # One Turnstile check covers the whole batch
+    if TURNSTILE_ENABLED:
+        client_ip = request.client.host if request.client else None
+        if not await verify_turnstile_token(turnstileToken, client_ip):
+            raise HTTPException(403, "Turnstile verification failed")
+    
+    if not images:
+        raise HTTPException(400, "No files provided")
+    
+    if len(images) > MAX_BATCH_FILES:
+        raise HTTPException(400, f"Too many files. Maximum is {MAX_BATCH_FILES} per batch")
+    
+    if sum(image.size or 0 for image in images) > MAX_BATCH_TOTAL_SIZE:
+        raise HTTPException(400, f"Batch too large. Maximum total size is {MAX_BATCH_TOTAL_SIZE // (1024 * 1024)}MB")
+    
+    results = [{"originalName": image.filename, "success": False} for image in images]
+    pending = []
+    for index, image in enumerate(images):
+        if not image.size:
+            results[index]["error"] = "No file provided"
+        elif image.size > MAX_FILE_SIZE:
+            results[index]["error"] = "File too large. Maximum size is 15MB"
+        else:
+            pending.append(index)
+    
+    # Validate and store the accepted files in parallel
+    outcomes = await asyncio.gather(
+        *(run_in_image_pool(store_batch_image, key, images[index]) for index in pending),
+        return_exceptions=True
+    )
+    
+    rows = []
+    for index, outcome in zip(pending, outcomes):
+        if isinstance(outcome, HTTPException):
+            results[index]["error"] = outcome.detail
+        elif isinstance(outcome, Exception):
+            logger.error(f"Error storing batch image {images[index].filename}: {outcome}")
+            results[index]["error"] = f"Failed to save image: {str(outcome)}"
+        else:
+            rows.append(outcome)
+            results[index].update(success=True, filename=outcome[1])
+    
+    if rows:
+        # All metadata in one transaction; on failure nothing of the batch is listed
+        try:
+            await asyncio.to_thread(repository.add_images, rows)
+        except Exception as e:
+            logger.error(f"Error saving batch metadata for dish {key}: {e}")
+            await asyncio.to_thread(image_storage.delete_many, [row[3] for row in rows])
+            raise HTTPException(400, f"Failed to save images: {str(e)}")
+        
+        response_cache.invalidate(images_cache_key(key))
+        logger.info(f"Batch uploaded {len(rows)} of {len(images)} images for dish {key}")
+    
+    return {
+        "success": bool(rows),
+        "uploaded": len(rows),
+        "results": results
+    }
+
 # Legacy PHP-style image endpoints (for backward compatibility)
-@app.get("/api/images.php")
+@router.get("/api/images.php")
 async def get_images(
+    request: Request,
     key: Optional[str] = Query(None, description="Image key"),
     action: Optional[str] = Query(None, description="Action"),
-    file: Optional[str] = Query(None, description="File name")
+    file: Optional[str] = Query(None, description="File name"),
+    limit: int = Query(DEFAULT_IMAGE_PAGE_SIZE, ge=1, le=MAX_IMAGE_PAGE_SIZE, description="Page size"),
+    before: Optional[str] = Query(None, description="Cursor returned as nextCursor by the previous page")
 ):
     """Get images for a dish or serve a specific image file (legacy endpoint)"""
     try:
@@ -708,7 +958,7 @@ async def get_images(
         if not key:
             raise HTTPException(400, "Dish key is required")
         
-        return await get_images_rest(key)
+        return await get_images_rest(key, request, limit, before)
     
     except HTTPException:
         raise
@@ -716,7 +966,7 @@ async def get_images(
         logger.error(f"Error in legacy images endpoint: {e}")
         raise HTTPException(400, f"Failed to process request: {str(e)}")
 
-@app.post("/api/images.php")
+@router.post("/api/images.php")
 async def upload_image(
     request: Request,
     key: str = Form(..., description="Image key"),
@@ -727,7 +977,7 @@ async def upload_image(
     return await upload_image_rest(request, key, image, turnstileToken)
 
 # AI API endpoints
-@app.post("/api/ai")
+@router.post("/api/ai")
 async def ai_chat(ai_request: AiRequest, request: Request):
     """Process AI chat request with streaming support"""
     try:
@@ -770,9 +1020,10 @@ async def ai_chat(ai_request: AiRequest, request: Request):
         logger.error(f"Unexpected AI chat error: {e}")
         return {"success": False, "error": f"Unexpected error: {str(e)}"}
 
-@app.get("/api/ai/health")
+@router.get("/api/ai/health")
 async def ai_health():
     """Check AI API health"""
+    import requests
     try:
         # Test the AI API with a simple request
         test_context = {
@@ -783,20 +1034,21 @@ async def ai_health():
             'date': 'today'
         }
         
-        response = requests.post(
-            AI_CONFIG['url'],
-            headers={'Content-Type': 'application/json'},
-            json={
-                'model': AI_CONFIG['model'],
-                'prompt': 'Test prompt',
-                'stream': False,
-                'options': {
-                    'temperature': 0.1,
-                    'num_predict': 10
-                }
-            },
-            timeout=5
-        )
+        with SUBSYSTEM_DURATION.time("upstream", "ai_health"):
+            response = requests.post(
+                AI_CONFIG['url'],
+                headers={'Content-Type': 'application/json'},
+                json={
+                    'model': AI_CONFIG['model'],
+                    'prompt': 'Test prompt',
+                    'stream': False,
+                    'options': {
+                        'temperature': 0.1,
+                        'num_predict': 10
+                    }
+                },
+                timeout=5
+            )
         
         if response.ok:
             return {"status": "healthy", "ai_service": "available"}
@@ -807,6 +1059,68 @@ async def ai_health():
         logger.warning(f"AI health check failed: {e}")
         return {"status": "degraded", "ai_service": "unavailable", "fallback": "active"}
 
+def create_app() -> FastAPI:
+    """Build the FastAPI app with its middleware and lifecycle hooks"""
+    app = FastAPI(
+        title="Eatinator API",
+        version="1.0.0",
+        default_response_class=TimedJSONResponse,
+        routes=router.routes,
+        on_startup=[startup_event],
+        on_shutdown=[shutdown_event],
+    )
+    
+    # Innermost, so oversized batches are rejected after the rate limit but before the form is parsed
+    app.add_middleware(
+        BodySizeLimitMiddleware,
+        limits={"/api/images/batch": MAX_BATCH_BODY_SIZE},
+        detail=f"Batch too large. Maximum total size is {MAX_BATCH_TOTAL_SIZE // (1024 * 1024)}MB",
+    )
+    
+    # Rate limiting runs before CORS so rejected requests still carry CORS headers
+    if RATE_LIMIT_ENABLED:
+        app.add_middleware(
+            RateLimitMiddleware,
+            limiter=create_rate_limiter(DATA_DIR, RATE_LIMIT_BACKEND),
+            policies=RATE_LIMIT_POLICIES,
+            trusted_proxies=RATE_LIMIT_TRUSTED_PROXIES,
+        )
+    
+    # While shutting down, answer 503 before spending rate-limit tokens; inside CORS so browsers see it
+    app.add_middleware(DrainMiddleware, drainer=drainer)
+    
+    # Add CORS middleware
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    
+    # Wraps CORS, draining and rate limiting, so rejected requests are measured too
+    app.add_middleware(
+        MetricsMiddleware,
+        routes=app.router.routes,
+        duration=REQUEST_DURATION,
+        in_flight=REQUESTS_IN_FLIGHT,
+        excluded_paths=("/metrics",),
+    )
+    
+    # Outermost: per-request phase breakdown, slow-request log and opt-in sampling profiles
+    app.add_middleware(
+        ProfilingMiddleware,
+        ring=ProfileRing(PROFILE_DIR, PROFILE_RING_SIZE),
+        sampler=StackSampler(),
+        secret=PROFILE_SECRET,
+        sample_rate=PROFILE_SAMPLE_RATE,
+        slow_threshold=SLOW_REQUEST_THRESHOLD_MS / 1000,
+    )
+    
+    return app
+
+app = create_app()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=5694)
\ No newline at end of file
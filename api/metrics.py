@@ -0,0 +1,272 @@
+"""
+Prometheus-style metrics for Eatinator
+Counters, gauges and histograms rendered in the Prometheus text format, with an
+optional directory of per-worker snapshots so one scrape covers every uvicorn worker
+"""
+
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Optional, Sequence, Tuple
+import bisect
+import json
+import logging
+import os
+import time
+
+from starlette.routing import Match
+
+logger = logging.getLogger(__name__)
+
+# Seconds; covers fast SQLite reads up to slow AI generations
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Metric:
+    """Base class holding one value per label combination
+
+    Updates are plain dict and list operations without locks. Handlers run on
+    the event loop thread, and the rare lost update from a thread-pool race is
+    acceptable for monitoring data.
+    """
+
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.values: Dict[Tuple[str, ...], object] = {}
+
+    def snapshot(self) -> list:
+        return [[list(labels), value] for labels, value in self.values.items()]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        self.values[labels] = self.values.get(labels, 0.0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        self.values[labels] = self.values.get(labels, 0.0) + amount
+
+    def dec(self, *labels: str, amount: float = 1.0):
+        self.values[labels] = self.values.get(labels, 0.0) - amount
+
+    def set(self, value: float, *labels: str):
+        self.values[labels] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(buckets)
+        # Callables receiving (value, labels) for every observation
+        self.listeners = []
+
+    def observe(self, value: float, *labels: str):
+        state = self.values.get(labels)
+        if state is None:
+            # Per-bucket counts (last slot is +Inf), then the sum of observations
+            state = self.values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        state[bisect.bisect_left(self.buckets, value)] += 1
+        state[-1] += value
+        for listener in self.listeners:
+            listener(value, labels)
+
+    @contextmanager
+    def time(self, *labels: str):
+        """Observe the duration of a with-block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+
+class MetricsRegistry:
+    """Collects metrics and renders them, merging snapshots of other workers"""
+
+    def __init__(self, multiprocess_dir: Optional[Path] = None, stale_after: float = 60.0):
+        self.metrics: Dict[str, Metric] = {}
+        self.multiprocess_dir = multiprocess_dir
+        self.stale_after = stale_after
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help_text, labelnames))
+
+    def gauge(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, help_text, labelnames))
+
+    def histogram(self, name: str, help_text: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help_text, labelnames, buckets))
+
+    def snapshot(self) -> dict:
+        return {name: metric.snapshot() for name, metric in self.metrics.items()}
+
+    def write_snapshot(self):
+        """Publish this worker's values for the other workers to merge"""
+        if not self.multiprocess_dir:
+            return
+        self.multiprocess_dir.mkdir(parents=True, exist_ok=True)
+        target = self.multiprocess_dir / f"{os.getpid()}.json"
+        temp = target.with_suffix(".tmp")
+        temp.write_text(json.dumps({"time": time.time(), "metrics": self.snapshot()}))
+        os.replace(temp, target)
+
+    def collect(self) -> Dict[str, dict]:
+        """Merge values from every worker, keyed by metric name then labels"""
+        snapshots = [{"time": time.time(), "metrics": self.snapshot()}]
+        if self.multiprocess_dir:
+            own = f"{os.getpid()}.json"
+            for path in self.multiprocess_dir.glob("*.json"):
+                if path.name == own:
+                    continue
+                try:
+                    snapshots.append(json.loads(path.read_text()))
+                except (OSError, ValueError):
+                    continue
+
+        now = time.time()
+        merged = {name: {} for name in self.metrics}
+        for snapshot in snapshots:
+            stale = now - snapshot.get("time", 0) > self.stale_after
+            for name, entries in snapshot["metrics"].items():
+                metric = self.metrics.get(name)
+                if metric is None or (stale and metric.kind == "gauge"):
+                    # Gauges of workers that stopped reporting would never go back down
+                    continue
+                values = merged[name]
+                for labels, value in entries:
+                    labels = tuple(labels)
+                    if metric.kind == "histogram":
+                        current = values.get(labels)
+                        values[labels] = list(value) if current is None else [a + b for a, b in zip(current, value)]
+                    else:
+                        values[labels] = values.get(labels, 0.0) + value
+        return merged
+
+    def render(self) -> str:
+        """Render all metrics in the Prometheus text exposition format"""
+        lines = []
+        for name, values in self.collect().items():
+            metric = self.metrics[name]
+            lines.append(f"# HELP {name} {metric.help}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            for labels, value in sorted(values.items()):
+                pairs = [f'{key}="{_escape(val)}"' for key, val in zip(metric.labelnames, labels)]
+                if metric.kind != "histogram":
+                    lines.append(f"{name}{_labels(pairs)} {_number(value)}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(metric.buckets + (float("inf"),), value[:-1]):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else _number(bound)
+                    le_pair = f'le="{le}"'
+                    lines.append(f"{name}_bucket{_labels(pairs + [le_pair])} {cumulative}")
+                lines.append(f"{name}_sum{_labels(pairs)} {_number(value[-1])}")
+                lines.append(f"{name}_count{_labels(pairs)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(pairs: list) -> str:
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording request duration and in-flight requests per route
+
+    The route label is the route's path template, so cardinality stays bounded
+    no matter which keys clients request.
+    """
+
+    def __init__(self, app, routes: list, duration: Histogram, in_flight: Gauge, excluded_paths: Sequence[str] = ()):
+        self.app = app
+        self.routes = routes
+        self.duration = duration
+        self.in_flight = in_flight
+        self.excluded_paths = set(excluded_paths)
+
+    def route_label(self, scope) -> str:
+        for route in self.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return route.path
+        return "unmatched"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.excluded_paths:
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        route = self.route_label(scope)
+        status = "500"
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+            await send(message)
+
+        self.in_flight.inc(method, route)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            self.duration.observe(time.perf_counter() - start, method, route, status)
+            self.in_flight.dec(method, route)
+
+
+class InstrumentedProxy:
+    """Wraps an object so every public method call is timed into a histogram
+
+    Used for the repository and image storage so each query or storage call is
+    recorded as subsystem/operation without touching the handlers.
+    """
+
+    def __init__(self, target, histogram: Histogram, subsystem: str):
+        self._target = target
+        self._histogram = histogram
+        self._subsystem = subsystem
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._target, name)
+        if name.startswith("_") or not callable(attr):
+            return attr
+
+        histogram = self._histogram
+        subsystem = self._subsystem
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return attr(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start, subsystem, name)
+
+        return timed
+
+    def __setattr__(self, name: str, value):
+        if name.startswith("_"):
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self._target, name, value)
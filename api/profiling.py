@@ -0,0 +1,214 @@
+"""
+Per-request profiling for Eatinator
+Opt-in sampling profiles written as folded stacks to a bounded on-disk ring,
+plus a per-phase time breakdown logged for slow requests
+"""
+
+from collections import Counter
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Optional
+import asyncio
+import hmac
+import logging
+import os
+import random
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Phase name -> seconds for the current request. The dict is shared with work
+# started through asyncio.to_thread, which copies the context.
+request_phases: ContextVar[Optional[dict]] = ContextVar("request_phases", default=None)
+
+
+def record_phase(phase: str, seconds: float):
+    """Add time spent in a phase to the current request's breakdown"""
+    phases = request_phases.get()
+    if phases is not None:
+        phases[phase] = phases.get(phase, 0.0) + seconds
+
+
+def format_phases(phases: dict, total: float) -> str:
+    """Render a breakdown like 'db=12.3ms upstream_http=980.1ms other=4.0ms'"""
+    parts = [f"{phase}={seconds * 1000:.1f}ms" for phase, seconds in sorted(phases.items(), key=lambda item: -item[1])]
+    other = total - sum(phases.values())
+    parts.append(f"other={max(other, 0.0) * 1000:.1f}ms")
+    return " ".join(parts)
+
+
+class StackSampler:
+    """Samples the stacks of all threads while at least one profile is active
+
+    One background thread serves every concurrent profile. Samples include all
+    work running at the same time (the event loop is shared between requests),
+    which is what a lunch-time spike actually looks like.
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.sessions = {}
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.thread = None
+
+    def start_session(self) -> Counter:
+        """Start collecting samples into a new Counter of folded stacks"""
+        session = Counter()
+        with self.lock:
+            self.sessions[id(session)] = session
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+                self.thread.start()
+        self.wakeup.set()
+        return session
+
+    def stop_session(self, session: Counter):
+        with self.lock:
+            self.sessions.pop(id(session), None)
+
+    def _run(self):
+        own_id = threading.get_ident()
+        names = {}
+        while True:
+            with self.lock:
+                active = bool(self.sessions)
+            if not active:
+                self.wakeup.clear()
+                self.wakeup.wait()
+                continue
+
+            stacks = []
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                if thread_id not in names:
+                    names = {thread.ident: thread.name for thread in threading.enumerate()}
+                stacks.append(self._fold(names.get(thread_id, str(thread_id)), frame))
+
+            # Under the lock, so a stopped session never changes while it is written out
+            with self.lock:
+                for session in self.sessions.values():
+                    session.update(stacks)
+            time.sleep(self.interval)
+
+    @staticmethod
+    def _fold(thread_name: str, frame) -> str:
+        """Turn a frame chain into one 'thread;outer;...;inner' line"""
+        parts = []
+        while frame is not None:
+            code = frame.f_code
+            parts.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+            frame = frame.f_back
+        parts.append(thread_name)
+        return ";".join(reversed(parts))
+
+
+class ProfileRing:
+    """Keeps the newest profiles as files in a directory, deleting the oldest"""
+
+    def __init__(self, directory: Path, size: int):
+        self.directory = directory
+        self.size = size
+
+    def write(self, name: str, stacks: Counter) -> Path:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / name
+        # Folded stack format: flamegraph.pl, speedscope and inferno read it directly
+        path.write_text("".join(f"{stack} {count}\n" for stack, count in stacks.most_common()))
+
+        profiles = sorted(self.directory.glob("*.folded"))
+        for old in profiles[:max(0, len(profiles) - self.size)]:
+            old.unlink(missing_ok=True)
+        return path
+
+
+class ProfilingMiddleware:
+    """ASGI middleware for per-phase timing, slow-request logs and opt-in profiles
+
+    A request is profiled when its X-Profile header matches the configured
+    secret or when it is picked by the sampling rate. Every request gets a
+    phase breakdown; the ones slower than the threshold are logged with it.
+    Server-sent event streams (AI chat) are judged by their time to the first
+    chunk, since their total time is how long the answer takes to stream.
+    """
+
+    def __init__(
+        self,
+        app,
+        ring: ProfileRing,
+        sampler: StackSampler,
+        secret: str = "",
+        sample_rate: float = 0.0,
+        slow_threshold: float = 1.0,
+    ):
+        self.app = app
+        self.ring = ring
+        self.sampler = sampler
+        self.secret = secret.encode()
+        self.sample_rate = sample_rate
+        self.slow_threshold = slow_threshold
+
+    def should_profile(self, scope) -> bool:
+        if self.secret:
+            for name, value in scope.get("headers") or []:
+                if name == b"x-profile":
+                    return hmac.compare_digest(value, self.secret)
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        phases = {}
+        token = request_phases.set(phases)
+        session = self.sampler.start_session() if self.should_profile(scope) else None
+        profile_name = None
+        if session is not None:
+            route = "".join(c if c.isalnum() else "_" for c in scope["path"].strip("/"))[:60]
+            profile_name = f"{time.time():.3f}_{os.getpid()}_{scope['method']}_{route}.folded"
+
+        streaming = False
+        first_chunk = None
+
+        async def send_wrapper(message):
+            nonlocal streaming, first_chunk
+            if message["type"] == "http.response.start":
+                streaming = any(
+                    name.lower() == b"content-type" and value.startswith(b"text/event-stream")
+                    for name, value in message.get("headers") or []
+                )
+                if profile_name:
+                    message["headers"] = list(message.get("headers") or []) + [(b"x-profile-id", profile_name.encode())]
+            elif streaming and first_chunk is None and message["type"] == "http.response.body":
+                if message.get("body") or not message.get("more_body", False):
+                    first_chunk = (time.perf_counter() - start, dict(phases))
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            total = time.perf_counter() - start
+            request_phases.reset(token)
+            if session is not None:
+                self.sampler.stop_session(session)
+                try:
+                    await asyncio.to_thread(self.ring.write, profile_name, session)
+                except OSError as e:
+                    logger.warning(f"Failed to write profile {profile_name}: {e}")
+            if streaming:
+                elapsed, breakdown = first_chunk or (total, phases)
+                if elapsed >= self.slow_threshold:
+                    logger.warning(
+                        f"Slow stream {scope['method']} {scope['path']} took {elapsed * 1000:.1f}ms "
+                        f"to the first chunk: {format_phases(breakdown, elapsed)}"
+                    )
+            elif total >= self.slow_threshold:
+                logger.warning(
+                    f"Slow request {scope['method']} {scope['path']} took {total * 1000:.1f}ms: "
+                    f"{format_phases(phases, total)}"
+                )
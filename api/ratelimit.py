@@ -0,0 +1,245 @@
+"""
+Token-bucket rate limiting for Eatinator
+Per-route policies enforced by an ASGI middleware before the request body is read
+"""
+
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional, Sequence, Tuple
+import ipaddress
+import json
+import logging
+import sqlite3
+import threading
+import time
+import zlib
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class RateLimitPolicy:
+    """Token bucket applied to requests matching a method and path prefix
+
+    rate is the refill speed in requests per second, burst the bucket size.
+    Buckets are keyed by client IP (see RateLimitMiddleware.client_ip).
+    """
+
+    name: str
+    methods: Tuple[str, ...]
+    path_prefixes: Tuple[str, ...]
+    rate: float
+    burst: int
+
+    def matches(self, method: str, path: str) -> bool:
+        return method in self.methods and path.startswith(self.path_prefixes)
+
+
+class MemoryRateLimiter:
+    """In-process token buckets split across lock-protected shards
+
+    Buckets idle for idle_ttl seconds are swept shard by shard, so eviction
+    never walks the whole table at once.
+    """
+
+    name = "memory"
+
+    def __init__(self, shards: int = 16, idle_ttl: float = 600.0, sweep_interval: float = 30.0):
+        self.shards = [{} for _ in range(shards)]
+        self.locks = [threading.Lock() for _ in range(shards)]
+        self.next_sweep = [0.0] * shards
+        self.idle_ttl = idle_ttl
+        self.sweep_interval = sweep_interval
+
+    def acquire(self, key: str, rate: float, burst: int) -> Tuple[bool, float]:
+        """Take one token; return (allowed, seconds until a token is available)"""
+        index = zlib.crc32(key.encode()) % len(self.shards)
+        buckets = self.shards[index]
+        now = time.monotonic()
+
+        with self.locks[index]:
+            if now >= self.next_sweep[index]:
+                self._sweep(buckets, now)
+                self.next_sweep[index] = now + self.sweep_interval
+
+            bucket = buckets.get(key)
+            if bucket is None:
+                buckets[key] = [burst - 1.0, now]
+                return True, 0.0
+
+            tokens = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            if tokens >= 1.0:
+                bucket[0] = tokens - 1.0
+                return True, 0.0
+            bucket[0] = tokens
+            return False, (1.0 - tokens) / rate
+
+    def _sweep(self, buckets: dict, now: float):
+        """Drop buckets that have not been touched for idle_ttl seconds"""
+        cutoff = now - self.idle_ttl
+        for key in [key for key, bucket in buckets.items() if bucket[1] < cutoff]:
+            del buckets[key]
+
+    def __len__(self):
+        return sum(len(buckets) for buckets in self.shards)
+
+
+class SqliteRateLimiter:
+    """Token buckets in a shared SQLite file so limits hold across uvicorn workers
+
+    Each check is a single atomic upsert; the file holds throwaway state, so
+    it runs in WAL mode without fsync.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, db_path: Path, idle_ttl: float = 600.0, sweep_interval: float = 30.0):
+        self.db_path = db_path
+        self.idle_ttl = idle_ttl
+        self.sweep_interval = sweep_interval
+        self.next_sweep = 0.0
+        self.local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        """One autocommit connection per thread, opened on the first request"""
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=1.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS rate_buckets (
+                    bucket_key TEXT PRIMARY KEY,
+                    tokens REAL NOT NULL,
+                    updated REAL NOT NULL,
+                    allowed INTEGER NOT NULL
+                )
+            ''')
+            self.local.conn = conn
+        return conn
+
+    def acquire(self, key: str, rate: float, burst: int) -> Tuple[bool, float]:
+        """Take one token; return (allowed, seconds until a token is available)"""
+        conn = self._connection()
+        now = time.time()
+
+        if now >= self.next_sweep:
+            self.next_sweep = now + self.sweep_interval
+            conn.execute("DELETE FROM rate_buckets WHERE updated < ?", (now - self.idle_ttl,))
+
+        tokens, allowed = conn.execute('''
+            INSERT INTO rate_buckets (bucket_key, tokens, updated, allowed)
+            VALUES (:key, :burst - 1.0, :now, 1)
+            ON CONFLICT (bucket_key) DO UPDATE SET
+                tokens = CASE
+                    WHEN min(:burst, tokens + (:now - updated) * :rate) >= 1.0
+                    THEN min(:burst, tokens + (:now - updated) * :rate) - 1.0
+                    ELSE min(:burst, tokens + (:now - updated) * :rate)
+                END,
+                allowed = min(:burst, tokens + (:now - updated) * :rate) >= 1.0,
+                updated = :now
+            RETURNING tokens, allowed
+        ''', {"key": key, "burst": float(burst), "rate": rate, "now": now}).fetchone()
+
+        if allowed:
+            return True, 0.0
+        return False, (1.0 - tokens) / rate
+
+
+class RateLimitMiddleware:
+    """ASGI middleware rejecting over-limit requests with 429 before routing
+
+    Runs ahead of body parsing, so a rejected upload costs one bucket lookup.
+    trusted_proxies lists the addresses or networks of reverse proxies whose
+    forwarding headers are believed; without it the socket peer is the client.
+    """
+
+    def __init__(self, app, limiter, policies: Sequence[RateLimitPolicy], trusted_proxies: Sequence[str] = ()):
+        self.app = app
+        self.limiter = limiter
+        self.policies = tuple(policies)
+        self.trusted_proxies = tuple(ipaddress.ip_network(proxy.strip(), strict=False) for proxy in trusted_proxies)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        policy = self._match(scope["method"], scope["path"])
+        if policy is None:
+            await self.app(scope, receive, send)
+            return
+
+        key = f"{policy.name}:{self.client_ip(scope)}"
+        try:
+            allowed, retry_after = self.limiter.acquire(key, policy.rate, policy.burst)
+        except Exception as e:
+            # Fail open: a broken limiter must not take the API down
+            logger.error(f"Rate limiter error: {e}")
+            allowed, retry_after = True, 0.0
+
+        if allowed:
+            await self.app(scope, receive, send)
+            return
+
+        body = json.dumps({"detail": "Too many requests"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(max(1, int(retry_after + 0.999))).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    def _match(self, method: str, path: str) -> Optional[RateLimitPolicy]:
+        for policy in self.policies:
+            if policy.matches(method, path):
+                return policy
+        return None
+
+    def _is_trusted(self, address: str) -> bool:
+        try:
+            ip = ipaddress.ip_address(address)
+        except ValueError:
+            return False
+        return any(ip in network for network in self.trusted_proxies)
+
+    def client_ip(self, scope) -> str:
+        """Address of the client, looking through trusted proxies only
+
+        X-Forwarded-For is read from the right: each proxy appends the address
+        it received the request from, so the right-most hop that is not one of
+        our proxies was added by a trusted proxy. Entries further left are
+        whatever the client sent and are ignored.
+        """
+        client = scope.get("client")
+        peer = client[0] if client else "unknown"
+        if not self.trusted_proxies or not self._is_trusted(peer):
+            return peer
+
+        headers = dict(scope.get("headers") or [])
+        forwarded = headers.get(b"x-forwarded-for")
+        if forwarded:
+            for hop in reversed(forwarded.decode("latin-1").split(",")):
+                hop = hop.strip()
+                if hop and not self._is_trusted(hop):
+                    return hop
+        # nginx overwrites X-Real-IP with the address it saw
+        real_ip = headers.get(b"x-real-ip")
+        if real_ip:
+            return real_ip.decode("latin-1").strip()
+        return peer
+
+
+def create_rate_limiter(data_dir: Path, backend: str):
+    """Build the limiter selected by RATE_LIMIT_BACKEND"""
+    if backend == "memory":
+        return MemoryRateLimiter()
+    if backend == "sqlite":
+        return SqliteRateLimiter(data_dir / "ratelimit.db")
+    raise RuntimeError(f"Unknown RATE_LIMIT_BACKEND: {backend}")
@@ -0,0 +1,596 @@
+"""
+Persistence layer for Eatinator
+Votes, user votes and image metadata behind one Repository interface with
+SQLite (default) and PostgreSQL implementations
+"""
+
+from pathlib import Path
+from typing import List, Optional, Tuple
+import logging
+import os
+import sqlite3
+
+logger = logging.getLogger(__name__)
+
+VOTE_TYPES = ("good", "neutral", "bad")
+
+
+class VoteRejected(Exception):
+    """Raised when a vote is not allowed (duplicate vote or limit reached)"""
+
+
+def encode_image_cursor(upload_time: int, image_id: int) -> str:
+    """Build an opaque pagination cursor from the last row of a page"""
+    return f"{upload_time}-{image_id}"
+
+
+def decode_image_cursor(cursor: str) -> Tuple[int, int]:
+    """Parse a pagination cursor into (upload_time, id), raising ValueError if malformed"""
+    upload_time, image_id = cursor.split("-", 1)
+    return int(upload_time), int(image_id)
+
+
+def votes_cache_key(vote_key: str) -> str:
+    """Response cache key of a vote listing (see cache.py)"""
+    return f"votes:{vote_key}"
+
+
+def images_cache_key(dish_key: str) -> str:
+    """Response cache key of an image listing (see cache.py)"""
+    return f"images:{dish_key}"
+
+
+def _paginate(rows: list, limit: int) -> Tuple[list, Optional[str]]:
+    """Trim the look-ahead row of a page and build the next cursor"""
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_image_cursor(rows[-1]["upload_time"], rows[-1]["id"])
+
+
+class Repository:
+    """Storage interface used by the API handlers
+
+    Image rows are dicts (or mappings) with id, filename, original_name,
+    upload_time and file_path.
+    """
+
+    name = "base"
+    # True when cache generations live in the database, shared by every replica
+    shared_cache_generations = False
+
+    def init_schema(self):
+        """Create tables and apply pending migrations"""
+        raise NotImplementedError
+
+    def get_votes(self, vote_key: str) -> dict:
+        """Return the good/neutral/bad counts for a key"""
+        raise NotImplementedError
+
+    def cast_vote(self, user_id: str, vote_key: str, vote_type: str, max_votes: int) -> dict:
+        """Record a user's vote and return the updated counts, raising VoteRejected if not allowed"""
+        raise NotImplementedError
+
+    def list_images(self, dish_key: str, limit: int, before: Optional[Tuple[int, int]] = None) -> Tuple[list, Optional[str]]:
+        """Return one page of image rows (newest first) and the cursor for the next page"""
+        raise NotImplementedError
+
+    def get_image_path(self, dish_key: str, filename: str) -> Optional[str]:
+        """Return the storage location of an image, or None if unknown"""
+        raise NotImplementedError
+
+    def add_image(self, dish_key: str, filename: str, original_name: str, file_path: str, upload_time: int):
+        """Record metadata for an uploaded image"""
+        raise NotImplementedError
+
+    def add_images(self, images: List[Tuple[str, str, str, str, int]]):
+        """Record metadata for several images in one transaction
+
+        Each entry is (dish_key, filename, original_name, file_path, upload_time).
+        """
+        raise NotImplementedError
+
+    def delete_images_before(self, cutoff_time: float) -> List[Tuple[str, str]]:
+        """Delete image rows older than cutoff_time and return their (dish_key, storage location)"""
+        raise NotImplementedError
+
+    def cache_generations(self, keys: List[str]) -> dict:
+        """Return the response cache version of each key
+
+        Keys never written, or pruned, share a version that changes whenever
+        prune_cache_generations() removes anything.
+        """
+        raise NotImplementedError
+
+    def prune_cache_generations(self, max_age: float) -> int:
+        """Remove generations of keys not written for max_age seconds"""
+        raise NotImplementedError
+
+    def close(self):
+        """Release pooled resources"""
+
+
+# Schema migrations, applied in order and tracked with PRAGMA user_version
+MIGRATIONS = [
+    # 1: index image listings, file lookups and retention cleanup
+    [
+        "CREATE INDEX IF NOT EXISTS idx_images_dish_upload ON images (dish_key, upload_time DESC, id DESC)",
+        "CREATE INDEX IF NOT EXISTS idx_images_dish_filename ON images (dish_key, filename)",
+        "CREATE INDEX IF NOT EXISTS idx_images_upload_time ON images (upload_time)",
+    ],
+]
+
+
+def run_migrations(conn: sqlite3.Connection) -> int:
+    """Apply pending schema migrations and return the resulting schema version"""
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+
+    for target, statements in enumerate(MIGRATIONS[version:], start=version + 1):
+        for statement in statements:
+            conn.execute(statement)
+        # PRAGMA does not accept bound parameters
+        conn.execute(f"PRAGMA user_version = {int(target)}")
+        conn.commit()
+        logger.info(f"Applied database migration {target}")
+        version = target
+
+    return version
+
+
+def fetch_image_page(conn: sqlite3.Connection, dish_key: str, limit: int, before: Optional[Tuple[int, int]] = None) -> Tuple[list, Optional[str]]:
+    """Fetch one page of image rows (newest first) and the cursor for the next page"""
+    query = '''
+        SELECT id, filename, original_name, upload_time, file_path
+        FROM images
+        WHERE dish_key = ? AND file_path IS NOT NULL
+    '''
+    params = [dish_key]
+
+    if before:
+        upload_time, image_id = before
+        query += " AND (upload_time < ? OR (upload_time = ? AND id < ?))"
+        params.extend([upload_time, upload_time, image_id])
+
+    # Fetch one extra row to find out whether another page exists
+    query += " ORDER BY upload_time DESC, id DESC LIMIT ?"
+    params.append(limit + 1)
+
+    return _paginate(conn.execute(query, params).fetchall(), limit)
+
+
+class SqliteRepository(Repository):
+    """Repository backed by a single SQLite file"""
+
+    name = "sqlite"
+
+    def __init__(self, db_path: Path):
+        self.db_path = db_path
+
+    def connect(self) -> sqlite3.Connection:
+        """Get database connection"""
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def init_schema(self):
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+
+        # Votes table
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS votes (
+                vote_key TEXT PRIMARY KEY,
+                good INTEGER DEFAULT 0,
+                neutral INTEGER DEFAULT 0,
+                bad INTEGER DEFAULT 0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
+        # User votes tracking table
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS user_votes (
+                user_id TEXT,
+                vote_key TEXT,
+                vote_type TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (user_id, vote_key)
+            )
+        ''')
+
+        # Image metadata table
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS images (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                dish_key TEXT,
+                filename TEXT,
+                original_name TEXT,
+                file_path TEXT,
+                upload_time INTEGER,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
+        run_migrations(conn)
+
+        conn.commit()
+        conn.close()
+
+    def get_votes(self, vote_key: str) -> dict:
+        conn = self.connect()
+        try:
+            result = conn.execute(
+                "SELECT good, neutral, bad FROM votes WHERE vote_key = ?",
+                (vote_key,)
+            ).fetchone()
+        finally:
+            conn.close()
+
+        if result:
+            return {"good": result["good"], "neutral": result["neutral"], "bad": result["bad"]}
+        return {"good": 0, "neutral": 0, "bad": 0}
+
+    def cast_vote(self, user_id: str, vote_key: str, vote_type: str, max_votes: int) -> dict:
+        if vote_type not in VOTE_TYPES:
+            raise ValueError(f"Invalid vote type: {vote_type}")
+
+        conn = self.connect()
+        try:
+            # Take the write lock up front so the checks and the increment are atomic
+            conn.execute("BEGIN IMMEDIATE")
+            cursor = conn.cursor()
+
+            # Check if user already voted for this item
+            cursor.execute(
+                "SELECT 1 FROM user_votes WHERE user_id = ? AND vote_key = ?",
+                (user_id, vote_key)
+            )
+            if cursor.fetchone():
+                raise VoteRejected("User has already voted for this item")
+
+            # Check vote limit per user
+            cursor.execute(
+                "SELECT COUNT(*) as count FROM user_votes WHERE user_id = ?",
+                (user_id,)
+            )
+            if cursor.fetchone()["count"] >= max_votes:
+                raise VoteRejected("Vote limit exceeded")
+
+            # Insert or update vote counts
+            cursor.execute(
+                "INSERT OR IGNORE INTO votes (vote_key) VALUES (?)",
+                (vote_key,)
+            )
+
+            cursor.execute(f'''
+                UPDATE votes
+                SET {vote_type} = {vote_type} + 1,
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE vote_key = ?
+            ''', (vote_key,))
+
+            # Record user vote
+            cursor.execute(
+                "INSERT INTO user_votes (user_id, vote_key, vote_type) VALUES (?, ?, ?)",
+                (user_id, vote_key, vote_type)
+            )
+
+            # Get updated votes
+            cursor.execute(
+                "SELECT good, neutral, bad FROM votes WHERE vote_key = ?",
+                (vote_key,)
+            )
+            result = cursor.fetchone()
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+        return {"good": result["good"], "neutral": result["neutral"], "bad": result["bad"]}
+
+    def list_images(self, dish_key: str, limit: int, before: Optional[Tuple[int, int]] = None) -> Tuple[list, Optional[str]]:
+        conn = self.connect()
+        try:
+            return fetch_image_page(conn, dish_key, limit, before)
+        finally:
+            conn.close()
+
+    def get_image_path(self, dish_key: str, filename: str) -> Optional[str]:
+        conn = self.connect()
+        try:
+            result = conn.execute(
+                "SELECT file_path FROM images WHERE dish_key = ? AND filename = ?",
+                (dish_key, filename)
+            ).fetchone()
+        finally:
+            conn.close()
+        return result["file_path"] if result else None
+
+    def add_image(self, dish_key: str, filename: str, original_name: str, file_path: str, upload_time: int):
+        conn = self.connect()
+        try:
+            conn.execute('''
+                INSERT INTO images (dish_key, filename, original_name, file_path, upload_time)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (dish_key, filename, original_name, file_path, upload_time))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def add_images(self, images: List[Tuple[str, str, str, str, int]]):
+        conn = self.connect()
+        try:
+            conn.executemany('''
+                INSERT INTO images (dish_key, filename, original_name, file_path, upload_time)
+                VALUES (?, ?, ?, ?, ?)
+            ''', images)
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def delete_images_before(self, cutoff_time: float) -> List[Tuple[str, str]]:
+        conn = self.connect()
+        try:
+            old_images = conn.execute(
+                "SELECT dish_key, file_path FROM images WHERE upload_time < ?",
+                (cutoff_time,)
+            ).fetchall()
+            conn.execute(
+                "DELETE FROM images WHERE upload_time < ?",
+                (cutoff_time,)
+            )
+            conn.commit()
+        finally:
+            conn.close()
+        return [(row["dish_key"], row["file_path"]) for row in old_images]
+
+
+class PostgresRepository(Repository):
+    """Repository backed by PostgreSQL through a psycopg connection pool
+
+    Vote counts are incremented server-side with INSERT ... ON CONFLICT DO UPDATE,
+    and a per-user advisory lock keeps the duplicate and limit checks atomic
+    across every API replica. Every write also bumps the response cache
+    generation of the listing it changes, in the same transaction, so cached
+    listings and ETags of all replicas follow it.
+    """
+
+    name = "postgres"
+    shared_cache_generations = True
+    # cache_generations row whose version is shared by keys without a row
+    CACHE_EPOCH_KEY = ""
+
+    SCHEMA = [
+        '''
+        CREATE TABLE IF NOT EXISTS votes (
+            vote_key TEXT PRIMARY KEY,
+            good INTEGER NOT NULL DEFAULT 0,
+            neutral INTEGER NOT NULL DEFAULT 0,
+            bad INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMPTZ DEFAULT now(),
+            updated_at TIMESTAMPTZ DEFAULT now()
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS user_votes (
+            user_id TEXT,
+            vote_key TEXT,
+            vote_type TEXT,
+            created_at TIMESTAMPTZ DEFAULT now(),
+            PRIMARY KEY (user_id, vote_key)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS images (
+            id BIGSERIAL PRIMARY KEY,
+            dish_key TEXT,
+            filename TEXT,
+            original_name TEXT,
+            file_path TEXT,
+            upload_time BIGINT,
+            created_at TIMESTAMPTZ DEFAULT now()
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_images_dish_upload ON images (dish_key, upload_time DESC, id DESC)",
+        "CREATE INDEX IF NOT EXISTS idx_images_dish_filename ON images (dish_key, filename)",
+        "CREATE INDEX IF NOT EXISTS idx_images_upload_time ON images (upload_time)",
+        '''
+        CREATE TABLE IF NOT EXISTS cache_generations (
+            cache_key TEXT PRIMARY KEY,
+            version BIGINT NOT NULL,
+            updated_at TIMESTAMPTZ DEFAULT now()
+        )
+        ''',
+    ]
+
+    def __init__(self, dsn: str, min_size: int = 1, max_size: int = 10):
+        try:
+            from psycopg.rows import dict_row
+            from psycopg_pool import ConnectionPool
+        except ImportError as e:
+            raise RuntimeError("The postgres database backend requires psycopg (pip install 'psycopg[binary]' psycopg_pool)") from e
+
+        self.pool = ConnectionPool(
+            dsn,
+            min_size=min_size,
+            max_size=max_size,
+            kwargs={"row_factory": dict_row},
+            open=True,
+        )
+
+    def init_schema(self):
+        with self.pool.connection() as conn:
+            for statement in self.SCHEMA:
+                conn.execute(statement)
+
+    @staticmethod
+    def _bump_generations(conn, keys):
+        with conn.cursor() as cursor:
+            cursor.executemany('''
+                INSERT INTO cache_generations (cache_key, version) VALUES (%s, 1)
+                ON CONFLICT (cache_key) DO UPDATE
+                SET version = cache_generations.version + 1, updated_at = now()
+            ''', [(key,) for key in sorted(set(keys))])
+
+    def get_votes(self, vote_key: str) -> dict:
+        with self.pool.connection() as conn:
+            result = conn.execute(
+                "SELECT good, neutral, bad FROM votes WHERE vote_key = %s",
+                (vote_key,)
+            ).fetchone()
+
+        if result:
+            return {"good": result["good"], "neutral": result["neutral"], "bad": result["bad"]}
+        return {"good": 0, "neutral": 0, "bad": 0}
+
+    def cast_vote(self, user_id: str, vote_key: str, vote_type: str, max_votes: int) -> dict:
+        from psycopg import sql
+
+        if vote_type not in VOTE_TYPES:
+            raise ValueError(f"Invalid vote type: {vote_type}")
+
+        column = sql.Identifier(vote_type)
+        with self.pool.connection() as conn, conn.transaction():
+            # Serialize votes of the same user; other users are not blocked
+            conn.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (user_id,))
+
+            counts = conn.execute(
+                '''
+                SELECT COUNT(*) AS total, COUNT(*) FILTER (WHERE vote_key = %s) AS this_key
+                FROM user_votes WHERE user_id = %s
+                ''',
+                (vote_key, user_id)
+            ).fetchone()
+            if counts["this_key"]:
+                raise VoteRejected("User has already voted for this item")
+            if counts["total"] >= max_votes:
+                raise VoteRejected("Vote limit exceeded")
+
+            conn.execute(
+                "INSERT INTO user_votes (user_id, vote_key, vote_type) VALUES (%s, %s, %s)",
+                (user_id, vote_key, vote_type)
+            )
+            result = conn.execute(
+                sql.SQL('''
+                    INSERT INTO votes (vote_key, {column}) VALUES (%s, 1)
+                    ON CONFLICT (vote_key) DO UPDATE
+                    SET {column} = votes.{column} + 1, updated_at = now()
+                    RETURNING good, neutral, bad
+                ''').format(column=column),
+                (vote_key,)
+            ).fetchone()
+            self._bump_generations(conn, [votes_cache_key(vote_key)])
+
+        return {"good": result["good"], "neutral": result["neutral"], "bad": result["bad"]}
+
+    def list_images(self, dish_key: str, limit: int, before: Optional[Tuple[int, int]] = None) -> Tuple[list, Optional[str]]:
+        query = '''
+            SELECT id, filename, original_name, upload_time, file_path
+            FROM images
+            WHERE dish_key = %s AND file_path IS NOT NULL
+        '''
+        params = [dish_key]
+
+        if before:
+            # Row comparison matches the (upload_time DESC, id DESC) index order
+            query += " AND (upload_time, id) < (%s, %s)"
+            params.extend(before)
+
+        query += " ORDER BY upload_time DESC, id DESC LIMIT %s"
+        params.append(limit + 1)
+
+        with self.pool.connection() as conn:
+            rows = conn.execute(query, params).fetchall()
+        return _paginate(rows, limit)
+
+    def get_image_path(self, dish_key: str, filename: str) -> Optional[str]:
+        with self.pool.connection() as conn:
+            result = conn.execute(
+                "SELECT file_path FROM images WHERE dish_key = %s AND filename = %s",
+                (dish_key, filename)
+            ).fetchone()
+        return result["file_path"] if result else None
+
+    def add_image(self, dish_key: str, filename: str, original_name: str, file_path: str, upload_time: int):
+        with self.pool.connection() as conn, conn.transaction():
+            conn.execute('''
+                INSERT INTO images (dish_key, filename, original_name, file_path, upload_time)
+                VALUES (%s, %s, %s, %s, %s)
+            ''', (dish_key, filename, original_name, file_path, upload_time))
+            self._bump_generations(conn, [images_cache_key(dish_key)])
+
+    def add_images(self, images: List[Tuple[str, str, str, str, int]]):
+        with self.pool.connection() as conn, conn.transaction():
+            with conn.cursor() as cursor:
+                cursor.executemany('''
+                    INSERT INTO images (dish_key, filename, original_name, file_path, upload_time)
+                    VALUES (%s, %s, %s, %s, %s)
+                ''', images)
+            self._bump_generations(conn, [images_cache_key(image[0]) for image in images])
+
+    def delete_images_before(self, cutoff_time: float) -> List[Tuple[str, str]]:
+        with self.pool.connection() as conn, conn.transaction():
+            rows = conn.execute(
+                "DELETE FROM images WHERE upload_time < %s RETURNING dish_key, file_path",
+                (int(cutoff_time),)
+            ).fetchall()
+            self._bump_generations(conn, [images_cache_key(row["dish_key"]) for row in rows])
+        return [(row["dish_key"], row["file_path"]) for row in rows]
+
+    def cache_generations(self, keys: List[str]) -> dict:
+        with self.pool.connection() as conn:
+            # The write time keeps versions unique after a key was pruned and written again
+            rows = conn.execute('''
+                SELECT cache_key, version || '.' || floor(extract(epoch FROM updated_at) * 1000000) AS version
+                FROM cache_generations WHERE cache_key = ANY(%s)
+            ''', ([self.CACHE_EPOCH_KEY, *keys],)).fetchall()
+        found = {row["cache_key"]: row["version"] for row in rows}
+        missing = f"0.{found.get(self.CACHE_EPOCH_KEY, 0)}"
+        return {key: found.get(key, missing) for key in keys}
+
+    def prune_cache_generations(self, max_age: float) -> int:
+        with self.pool.connection() as conn, conn.transaction():
+            removed = conn.execute(
+                "DELETE FROM cache_generations WHERE cache_key <> %s AND updated_at < now() - make_interval(secs => %s)",
+                (self.CACHE_EPOCH_KEY, max_age)
+            ).rowcount
+            if removed:
+                # Pruned keys must not return to the version they had before their first write
+                self._bump_generations(conn, [self.CACHE_EPOCH_KEY])
+        return removed
+
+    def close(self):
+        self.pool.close()
+
+
+REPOSITORY_BACKENDS = {"sqlite": SqliteRepository, "postgres": PostgresRepository}
+
+
+def repository_class() -> type:
+    """Return the repository class selected by DATABASE_BACKEND, without building it"""
+    backend = os.getenv("DATABASE_BACKEND", "sqlite").lower()
+    if backend not in REPOSITORY_BACKENDS:
+        raise RuntimeError(f"Unknown DATABASE_BACKEND: {backend}")
+    return REPOSITORY_BACKENDS[backend]
+
+
+def create_repository(db_path: Path) -> Repository:
+    """Build the repository selected by DATABASE_BACKEND"""
+    if repository_class() is SqliteRepository:
+        return SqliteRepository(db_path)
+
+    dsn = os.getenv("DATABASE_URL", "")
+    if not dsn:
+        raise RuntimeError("DATABASE_URL must be set when DATABASE_BACKEND=postgres")
+    return PostgresRepository(
+        dsn,
+        min_size=int(os.getenv("DB_POOL_MIN_SIZE", "1")),
+        max_size=int(os.getenv("DB_POOL_MAX_SIZE", "10")),
+    )
@@ -0,0 +1,216 @@
+"""
+Image storage backends for Eatinator
+Image bytes live behind an ImageStorage so several API replicas can share one bucket
+"""
+
+from fastapi.responses import FileResponse, RedirectResponse, Response, StreamingResponse
+from pathlib import Path
+from typing import BinaryIO, Iterable, Optional
+import logging
+import os
+import shutil
+
+logger = logging.getLogger(__name__)
+
+
+class ImageStorage:
+    """Interface for storing and serving uploaded image files
+
+    Every backend returns a location string from save(). The location is stored
+    in images.file_path and handed back to the other methods unchanged.
+    """
+
+    name = "base"
+
+    def save(self, dish_dir: str, filename: str, fileobj: BinaryIO, content_type: str) -> str:
+        """Store an image and return its location"""
+        raise NotImplementedError
+
+    def exists(self, location: str) -> bool:
+        """Check whether an image is still available"""
+        raise NotImplementedError
+
+    def delete_many(self, locations: Iterable[str]) -> int:
+        """Delete images, ignoring ones that are already gone, and return how many were removed"""
+        raise NotImplementedError
+
+    def response(self, location: str, media_type: str) -> Optional[Response]:
+        """Build a response serving the image, or None if it does not exist"""
+        raise NotImplementedError
+
+
+class LocalImageStorage(ImageStorage):
+    """Stores images as files below a local directory"""
+
+    name = "local"
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+
+    def save(self, dish_dir: str, filename: str, fileobj: BinaryIO, content_type: str) -> str:
+        target_dir = self.root / dish_dir
+        target_dir.mkdir(parents=True, exist_ok=True)
+        file_path = target_dir / filename
+        with file_path.open("wb") as buffer:
+            shutil.copyfileobj(fileobj, buffer)
+        # Absolute paths keep rows written before storage backends existed valid
+        return str(file_path)
+
+    def exists(self, location: str) -> bool:
+        return Path(location).exists()
+
+    def delete_many(self, locations: Iterable[str]) -> int:
+        removed = 0
+        for location in locations:
+            file_path = Path(location)
+            if file_path.exists():
+                file_path.unlink()
+                removed += 1
+        return removed
+
+    def response(self, location: str, media_type: str) -> Optional[Response]:
+        if not Path(location).exists():
+            return None
+        return FileResponse(location, media_type=media_type)
+
+
+class S3ImageStorage(ImageStorage):
+    """Stores images in an S3-compatible bucket (AWS S3, MinIO, R2, ...)
+
+    Uses one shared boto3 client with a pooled HTTP connection set, multipart
+    uploads above the configured threshold and, optionally, redirects image
+    downloads to presigned URLs so bytes never pass through the API.
+    """
+
+    name = "s3"
+    SCHEME = "s3://"
+
+    def __init__(
+        self,
+        bucket: str,
+        prefix: str = "images",
+        endpoint_url: Optional[str] = None,
+        region: Optional[str] = None,
+        access_key: Optional[str] = None,
+        secret_key: Optional[str] = None,
+        max_pool_connections: int = 32,
+        multipart_threshold: int = 8 * 1024 * 1024,
+        multipart_chunksize: int = 8 * 1024 * 1024,
+        presigned_urls: bool = False,
+        presign_expires: int = 3600,
+    ):
+        try:
+            import boto3
+            from boto3.s3.transfer import TransferConfig
+            from botocore.config import Config
+        except ImportError as e:
+            raise RuntimeError("The s3 image storage backend requires boto3 (pip install boto3)") from e
+
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self.presigned_urls = presigned_urls
+        self.presign_expires = presign_expires
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=endpoint_url,
+            region_name=region,
+            aws_access_key_id=access_key,
+            aws_secret_access_key=secret_key,
+            config=Config(
+                max_pool_connections=max_pool_connections,
+                retries={"max_attempts": 3, "mode": "standard"},
+                s3={"addressing_style": "path" if endpoint_url else "auto"},
+            ),
+        )
+        self.transfer_config = TransferConfig(
+            multipart_threshold=multipart_threshold,
+            multipart_chunksize=multipart_chunksize,
+            max_concurrency=4,
+        )
+
+    def _object_key(self, location: str) -> str:
+        """Strip the s3://bucket/ prefix from a stored location"""
+        return location[len(f"{self.SCHEME}{self.bucket}/"):]
+
+    def save(self, dish_dir: str, filename: str, fileobj: BinaryIO, content_type: str) -> str:
+        object_key = "/".join(part for part in (self.prefix, dish_dir, filename) if part)
+        self.client.upload_fileobj(
+            fileobj,
+            self.bucket,
+            object_key,
+            ExtraArgs={"ContentType": content_type},
+            Config=self.transfer_config,
+        )
+        return f"{self.SCHEME}{self.bucket}/{object_key}"
+
+    def exists(self, location: str) -> bool:
+        # The images table is the source of truth for listings; a HEAD request per
+        # row would cost one round trip per image. Missing objects surface as 404
+        # when the file itself is requested.
+        return location.startswith(self.SCHEME)
+
+    def delete_many(self, locations: Iterable[str]) -> int:
+        keys = [self._object_key(location) for location in locations if location.startswith(self.SCHEME)]
+        removed = 0
+        # DeleteObjects accepts at most 1000 keys per call
+        for start in range(0, len(keys), 1000):
+            batch = keys[start:start + 1000]
+            result = self.client.delete_objects(
+                Bucket=self.bucket,
+                Delete={"Objects": [{"Key": key} for key in batch], "Quiet": True},
+            )
+            for error in result.get("Errors", []):
+                logger.warning(f"Failed to delete {error.get('Key')} from S3: {error.get('Message')}")
+            removed += len(batch) - len(result.get("Errors", []))
+        return removed
+
+    def response(self, location: str, media_type: str) -> Optional[Response]:
+        from botocore.exceptions import ClientError
+
+        object_key = self._object_key(location)
+        if self.presigned_urls:
+            url = self.client.generate_presigned_url(
+                "get_object",
+                Params={"Bucket": self.bucket, "Key": object_key, "ResponseContentType": media_type},
+                ExpiresIn=self.presign_expires,
+            )
+            return RedirectResponse(url, status_code=302)
+
+        try:
+            obj = self.client.get_object(Bucket=self.bucket, Key=object_key)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+                return None
+            raise
+
+        return StreamingResponse(
+            obj["Body"].iter_chunks(chunk_size=64 * 1024),
+            media_type=media_type,
+            headers={"Content-Length": str(obj["ContentLength"])},
+        )
+
+
+def create_image_storage(images_dir: Path) -> ImageStorage:
+    """Build the image storage backend selected by IMAGE_STORAGE_BACKEND"""
+    backend = os.getenv("IMAGE_STORAGE_BACKEND", "local").lower()
+
+    if backend == "local":
+        return LocalImageStorage(images_dir)
+
+    if backend == "s3":
+        bucket = os.getenv("S3_BUCKET", "")
+        if not bucket:
+            raise RuntimeError("S3_BUCKET must be set when IMAGE_STORAGE_BACKEND=s3")
+        return S3ImageStorage(
+            bucket=bucket,
+            prefix=os.getenv("S3_PREFIX", "images"),
+            endpoint_url=os.getenv("S3_ENDPOINT_URL") or None,
+            region=os.getenv("S3_REGION") or None,
+            access_key=os.getenv("S3_ACCESS_KEY_ID") or None,
+            secret_key=os.getenv("S3_SECRET_ACCESS_KEY") or None,
+            max_pool_connections=int(os.getenv("S3_MAX_POOL_CONNECTIONS", "32")),
+            presigned_urls=os.getenv("S3_PRESIGNED_URLS", "").lower() in ("1", "true", "yes"),
+            presign_expires=int(os.getenv("S3_PRESIGN_EXPIRES", "3600")),
+        )
+
+    raise RuntimeError(f"Unknown IMAGE_STORAGE_BACKEND: {backend}")